@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.core import checks
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from utils.cache_checks import check_shared_cache
+        from utils.db_router import check_replica_pin_cache
+
+        checks.register(check_shared_cache, checks.Tags.caches)
+        checks.register(check_replica_pin_cache, checks.Tags.caches)
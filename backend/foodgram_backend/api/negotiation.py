@@ -0,0 +1,12 @@
+from rest_framework.negotiation import DefaultContentNegotiation
+
+
+class FileFormatNegotiation(DefaultContentNegotiation):
+    """Согласование формата, не учитывающее параметр format.
+
+    Для выгрузок параметр format задаёт формат файла, а не рендерер DRF,
+    поэтому список рендереров по нему не фильтруется.
+    """
+
+    def filter_renderers(self, renderers, format):
+        return renderers
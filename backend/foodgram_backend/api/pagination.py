@@ -1,5 +1,182 @@
-from rest_framework.pagination import PageNumberPagination
+from base64 import b64decode, b64encode
+from binascii import Error as BinasciiError
+from json import JSONDecodeError, dumps, loads
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from utils import text_constants
 
 
 class LimitedPagination(PageNumberPagination):
     page_size_query_param = 'limit'
+
+
+class KeysetPagination(BasePagination):
+    """Пагинация по ключу (курсору) без OFFSET и COUNT.
+
+    Страница выбирается условием на поля ordering относительно последней
+    (или первой) записи предыдущей страницы, поэтому глубокие страницы
+    стоят столько же, сколько первая. Последнее поле ordering должно
+    быть уникальным.
+    """
+
+    ordering = ('-pub_date', '-id')
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = 100
+
+    def get_page_size(self, request):
+        limit = request.query_params.get(self.page_size_query_param)
+        if limit and limit.isdigit() and int(limit) > 0:
+            return min(int(limit), self.max_page_size)
+        return self.page_size
+
+    def decode_cursor(self, request, queryset):
+        """Направление и значения полей ordering из параметра cursor."""
+
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return False, None
+        try:
+            reverse, values = loads(b64decode(encoded.encode()))
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return bool(reverse), [
+                queryset.model._meta.get_field(
+                    name.lstrip('-')
+                ).to_python(value)
+                for name, value in zip(self.ordering, values)
+            ]
+        except (
+            BinasciiError, JSONDecodeError, TypeError,
+            ValueError, ValidationError
+        ):
+            raise NotFound(text_constants.INVALID_CURSOR)
+
+    def encode_cursor(self, instance, reverse):
+        values = [
+            getattr(instance, name.lstrip('-')) for name in self.ordering
+        ]
+        return b64encode(dumps(
+            (reverse, [
+                value.isoformat() if hasattr(value, 'isoformat') else value
+                for value in values
+            ])
+        ).encode()).decode()
+
+    def keyset_filter(self, values, reverse):
+        """Условие "запись после values" для сортировки ordering."""
+
+        condition = Q()
+        for position in range(len(self.ordering) - 1, -1, -1):
+            name = self.ordering[position]
+            descending = name.startswith('-') != reverse
+            lookup = 'lt' if descending else 'gt'
+            field = name.lstrip('-')
+            step = Q(**{f'{field}__{lookup}': values[position]})
+            if position < len(self.ordering) - 1:
+                step |= Q(**{field: values[position]}) & condition
+            condition = step
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        reverse, values = self.decode_cursor(request, queryset)
+        ordering = [
+            (name.lstrip('-') if name.startswith('-') else f'-{name}')
+            if reverse else name
+            for name in self.ordering
+        ]
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self.keyset_filter(values, reverse))
+        page = list(queryset[:self.page_size_value + 1])
+        has_more = len(page) > self.page_size_value
+        page = page[:self.page_size_value]
+        if reverse:
+            page.reverse()
+        self.has_next = has_more if not reverse else values is not None
+        self.has_previous = (
+            values is not None if not reverse else has_more
+        )
+        self.page = page
+        return page
+
+    def get_link(self, instance, reverse):
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(instance, reverse)
+        )
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.get_link(self.page[-1], False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.get_link(self.page[0], True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class OptionalKeysetPagination(BasePagination):
+    """Постраничная пагинация с включаемым режимом курсора.
+
+    Параметр cursor в запросе (в том числе пустой - первая страница)
+    переключает на KeysetPagination, без него работает page_class.
+    Курсор не применяется, если задан параметр из ranked_params:
+    их сортировка (например, по релевантности поиска) не совпадает
+    с ordering курсора и была бы им заменена.
+    """
+
+    page_class = LimitedPagination
+    keyset_class = KeysetPagination
+    ranked_params = ('search',)
+
+    def use_keyset(self, request):
+        return (
+            KeysetPagination.cursor_query_param in request.query_params
+            and not any(
+                request.query_params.get(name)
+                for name in self.ranked_params
+            )
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_keyset(request):
+            self.paginator = self.keyset_class()
+        else:
+            self.paginator = self.page_class()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+
+class AuthorKeysetPagination(KeysetPagination):
+    """Пагинация авторов по курсору id."""
+
+    ordering = ('id',)
+
+
+class SubscriptionPagination(OptionalKeysetPagination):
+    """Пагинация подписок: по страницам или по курсору id автора."""
+
+    page_class = PageNumberPagination
+    keyset_class = AuthorKeysetPagination
@@ -1,14 +1,20 @@
 import base64
 
 from django.core.files.base import ContentFile
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers
 
+from recipe.images import image_variant_urls
 from recipe.models import (
     Favorite, Ingredient, Recipe,
     RecipeIngredients, ShoppingCart, Tag
 )
 from user.models import Follow, User
+from utils.metrics import SerializationMetricsMixin
+from utils.shopping_list import (
+    recipe_amounts, update_recipe_in_shopping_lists
+)
 
 
 class CustomUserCreateSerializer(UserCreateSerializer):
@@ -26,7 +32,7 @@ class CustomUserCreateSerializer(UserCreateSerializer):
         )
 
 
-class CustomUserSerializer(UserSerializer):
+class CustomUserSerializer(SerializationMetricsMixin, UserSerializer):
     """Сериализатор пользователя."""
 
     is_subscribed = serializers.SerializerMethodField()
@@ -45,6 +51,8 @@ class CustomUserSerializer(UserSerializer):
     def get_is_subscribed(self, obj):
         """Проверка наличия подписки."""
 
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if request.user.is_anonymous:
             return False
@@ -54,7 +62,7 @@ class CustomUserSerializer(UserSerializer):
         ).exists()
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(SerializationMetricsMixin, serializers.ModelSerializer):
     """Сериализатор тега."""
 
     class Meta:
@@ -85,6 +93,10 @@ class IngredientIDAmountSerializer(serializers.ModelSerializer):
 class IngredientSerializer(IngredientIDAmountSerializer):
     """Сериализатор количества ингредиента для рецептов."""
 
+    id = serializers.IntegerField(
+        read_only=True,
+        source='ingredient_id'
+    )
     name = serializers.CharField(
         read_only=True,
         source='ingredient.name'
@@ -104,7 +116,10 @@ class IngredientSerializer(IngredientIDAmountSerializer):
         )
 
 
-class IngredientDetailSerializer(serializers.ModelSerializer):
+class IngredientDetailSerializer(
+    SerializationMetricsMixin,
+    serializers.ModelSerializer
+):
     """Сериализатор одного ингредиента для страницы ингредиентов."""
 
     class Meta:
@@ -116,6 +131,13 @@ class IngredientDetailSerializer(serializers.ModelSerializer):
         )
 
 
+class IngredientAmountWriteSerializer(serializers.Serializer):
+    """Сериализатор ингредиента при записи рецепта: id и amount."""
+
+    id = serializers.IntegerField()
+    amount = serializers.IntegerField(min_value=1)
+
+
 class Base64ImageField(serializers.ImageField):
     """Сериализатор для картинок."""
 
@@ -130,7 +152,26 @@ class Base64ImageField(serializers.ImageField):
         return super().to_internal_value(data)
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class ImageVariantsMixin(serializers.Serializer):
+    """Поле со ссылками на уменьшенные копии картинки рецепта."""
+
+    image_variants = serializers.SerializerMethodField()
+
+    def get_image_variants(self, obj):
+        """Ссылки на варианты card, detail и webp."""
+
+        request = self.context.get('request')
+        return image_variant_urls(
+            obj,
+            request.build_absolute_uri if request else None
+        )
+
+
+class RecipeSerializer(
+    SerializationMetricsMixin,
+    ImageVariantsMixin,
+    serializers.ModelSerializer
+):
     """Сериализатор для одного рецепта."""
 
     tags = TagSerializer(many=True)
@@ -150,6 +191,7 @@ class RecipeSerializer(serializers.ModelSerializer):
             'ingredients',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time'
         )
@@ -172,13 +214,20 @@ class RecipeListSerializer(RecipeSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time'
         )
 
     def get_is_favorited(self, obj):
-        """Проверка наличия рецепта в избранном."""
+        """Проверка наличия рецепта в избранном.
 
+        Используется аннотация из RecipeQuerySet.with_user_flags,
+        запрос к БД выполняется только при её отсутствии.
+        """
+
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         if request.user.is_anonymous:
             return False
@@ -188,8 +237,14 @@ class RecipeListSerializer(RecipeSerializer):
         ).exists()
 
     def get_is_in_shopping_cart(self, obj):
-        """Проверка наличия рецепта в корзине."""
+        """Проверка наличия рецепта в корзине.
+
+        Используется аннотация из RecipeQuerySet.with_user_flags,
+        запрос к БД выполняется только при её отсутствии.
+        """
 
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         if request.user.is_anonymous:
             return False
@@ -223,8 +278,14 @@ class RecipeDetailSerializer(serializers.ModelSerializer):
 class RecipeCreateSerializer(serializers.ModelSerializer):
     """Сериализатор для создания рецепта."""
 
-    tags = serializers.ListField(required=True)
-    ingredients = serializers.ListField(required=True)
+    tags = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=True
+    )
+    ingredients = serializers.ListField(
+        child=IngredientAmountWriteSerializer(),
+        required=True
+    )
     image = Base64ImageField(required=True)
 
     class Meta:
@@ -241,63 +302,84 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ('author',)
 
-    def create_ingredients(self, ingredient_data, recipe):
-        """Получение ингредиента, создание связи, возврат ингредиента."""
+    def create_ingredients(self, recipe, ingredients):
+        """Создание связей рецепта с ингредиентами одним запросом."""
 
-        ingredient = Ingredient.objects.get(pk=ingredient_data['id'])
-        RecipeIngredients.objects.create(
-            recipe=recipe,
-            ingredient=ingredient,
-            amount=ingredient_data['amount']
-        )
-        return ingredient
+        RecipeIngredients.objects.bulk_create([
+            RecipeIngredients(
+                recipe=recipe,
+                ingredient=ingredient_data['ingredient'],
+                amount=ingredient_data['amount']
+            )
+            for ingredient_data in ingredients
+        ])
 
     def create(self, validated_data):
         """Создание рецепта."""
 
-        tags_list = []
-        ingredient_list = []
         author = self.context.get('request').user
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
-        recipe = Recipe.objects.create(author=author, **validated_data)
-        for id in tags:
-            if id:
-                tag = Tag.objects.get(id=id)
-                tags_list.append(tag)
-        for ingredient_data in ingredients:
-            ingredient = self.create_ingredients(
-                ingredient_data,
-                recipe
-            )
-            ingredient_list.append(ingredient)
-        recipe.tags.set(tags_list)
-        recipe.ingredients.set(ingredient_list)
+        with transaction.atomic():
+            recipe = Recipe.objects.create(author=author, **validated_data)
+            recipe.tags.set(tags)
+            self.create_ingredients(recipe, ingredients)
         return recipe
 
+    def update_ingredients(self, recipe, ingredients):
+        """Приведение связей рецепта с ингредиентами к новому списку.
+
+        Вычисляется разница с текущими связями: новые добавляются,
+        изменённые количества обновляются, лишние и повторяющиеся
+        связи удаляются - по одному запросу на каждое действие.
+        """
+
+        amounts = {
+            ingredient_data['ingredient'].id: ingredient_data['amount']
+            for ingredient_data in ingredients
+        }
+        kept = {}
+        to_update = []
+        to_delete = []
+        for link in recipe.recipe_ingredients.all():
+            if link.ingredient_id not in amounts or (
+                link.ingredient_id in kept
+            ):
+                to_delete.append(link.pk)
+                continue
+            kept[link.ingredient_id] = link
+            if link.amount != amounts[link.ingredient_id]:
+                link.amount = amounts[link.ingredient_id]
+                to_update.append(link)
+        RecipeIngredients.objects.filter(pk__in=to_delete).delete()
+        RecipeIngredients.objects.bulk_update(to_update, ('amount',))
+        RecipeIngredients.objects.bulk_create([
+            RecipeIngredients(
+                recipe=recipe,
+                ingredient=ingredient_data['ingredient'],
+                amount=ingredient_data['amount']
+            )
+            for ingredient_data in ingredients
+            if ingredient_data['ingredient'].id not in kept
+        ])
+
     def update(self, instance, validated_data):
         """Обновление рецепта."""
 
-        ingredient_list = []
-        ingredients = validated_data.get('ingredients')
-        instance.name = validated_data.get('name', instance.name)
-        instance.text = validated_data.get('text', instance.text)
-        instance.cooking_time = validated_data.get(
-            'cooking_time',
-            instance.cooking_time
-        )
-        instance.image = validated_data.get('image', instance.image)
-        instance.tags.set(validated_data.get('tags', instance.tags))
-        for ingredient_data in ingredients:
-            ingredient = self.create_ingredients(
-                ingredient_data,
-                instance
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        with transaction.atomic():
+            old_amounts = recipe_amounts(instance)
+            instance = super().update(instance, validated_data)
+            if tags is not None:
+                instance.tags.set(tags)
+            if ingredients is not None:
+                self.update_ingredients(instance, ingredients)
+            update_recipe_in_shopping_lists(
+                instance,
+                old_amounts,
+                recipe_amounts(instance)
             )
-            ingredient_list.append(ingredient)
-
-        ingredient_list.append(ingredient)
-        instance.ingredients.set(ingredient_list)
-        instance.save()
         return instance
 
     def to_representation(self, instance):
@@ -305,15 +387,17 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
 
         request = self.context.get('request')
         context = {'request': request}
+        instance = Recipe.objects.for_user(request.user).get(
+            pk=instance.pk
+        )
         serializer = RecipeListSerializer(instance, context=context)
         data = serializer.data
-        data['is_favorite'] = serializer.get_is_favorited(instance)
-        data['is_in_shopping_cart'] = serializer.get_is_in_shopping_cart(
-            instance
-        )
+        data['is_favorite'] = data['is_favorited']
         return data
 
     def validate_tags(self, tags):
+        """Проверка тегов и их получение одним запросом."""
+
         tags_len = len(tags)
         if tags_len == 0:
             raise serializers.ValidationError(
@@ -323,22 +407,49 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Теги должны быть уникальными.'
             )
-        return tags
+        tags_by_id = Tag.objects.in_bulk(tags)
+        if len(tags_by_id) != tags_len:
+            raise serializers.ValidationError(
+                'Несуществующие теги: '
+                + ', '.join(str(id) for id in tags if id not in tags_by_id)
+            )
+        return [tags_by_id[id] for id in tags]
 
     def validate_ingredients(self, ingredients):
+        """Проверка ингредиентов и их получение одним запросом."""
+
         ingredints_len = len(ingredients)
         if ingredints_len == 0:
             raise serializers.ValidationError(
                 'Необходимо добавить хотя бы 1 ингредиент.'
             )
-        if ingredints_len != len(set(ingredients)):
+        ids = [ingredient['id'] for ingredient in ingredients]
+        if ingredints_len != len(set(ids)):
             raise serializers.ValidationError(
                 'Ингредиенты должны быть уникальными.'
             )
-        return ingredients
-
-
-class RecipeSerializerShort(serializers.ModelSerializer):
+        ingredients_by_id = Ingredient.objects.in_bulk(ids)
+        if len(ingredients_by_id) != ingredints_len:
+            raise serializers.ValidationError(
+                'Несуществующие ингредиенты: '
+                + ', '.join(
+                    str(id) for id in ids if id not in ingredients_by_id
+                )
+            )
+        return [
+            {
+                'ingredient': ingredients_by_id[ingredient['id']],
+                'amount': ingredient['amount']
+            }
+            for ingredient in ingredients
+        ]
+
+
+class RecipeSerializerShort(
+    SerializationMetricsMixin,
+    ImageVariantsMixin,
+    serializers.ModelSerializer
+):
     """Короткий сериализатор рецепта."""
 
     image = Base64ImageField(required=False, allow_null=True)
@@ -349,6 +460,7 @@ class RecipeSerializerShort(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_variants',
             'cooking_time'
         )
 
@@ -357,7 +469,7 @@ class SubscriptionListSerializer(CustomUserSerializer):
     """Сериализатор для подписок."""
 
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
@@ -366,17 +478,18 @@ class SubscriptionListSerializer(CustomUserSerializer):
         )
 
     def get_recipes(self, obj):
-        """Получение рецептов."""
+        """Получение рецептов.
+
+        Используются рецепты, предзагруженные UserQuerySet.with_recipes,
+        запрос к БД выполняется только при их отсутствии.
+        """
 
+        if hasattr(obj, 'limited_recipes'):
+            return RecipeSerializerShort(obj.limited_recipes, many=True).data
         queryset = Recipe.objects.filter(author=obj)
         request = self.context.get('request')
         if request:
             recipes_limit = request.query_params.get('recipes_limit')
-            if recipes_limit:
+            if recipes_limit and recipes_limit.isdigit():
                 queryset = queryset[:int(recipes_limit)]
         return RecipeSerializerShort(queryset, many=True).data
-
-    def get_recipes_count(self, obj):
-        """Получение количества рецептов."""
-
-        return Recipe.objects.filter(author_id=obj.id).count()
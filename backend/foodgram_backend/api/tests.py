@@ -0,0 +1,306 @@
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connection
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from recipe.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredients, ShoppingCart, Tag
+)
+from user.models import Follow
+from utils.async_views import StreamingASGIHandler
+from utils.cache_checks import check_shared_cache
+
+User = get_user_model()
+
+RECIPES_URL = '/api/recipes/'
+RECIPES_COUNT = 100
+
+
+class RecipeListQueriesTest(APITestCase):
+    """Число SQL-запросов списка рецептов не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader',
+            email='reader@example.com',
+            password='password',
+            first_name='reader',
+            last_name='reader',
+        )
+        authors = [
+            User.objects.create_user(
+                username=f'author_{index}',
+                email=f'author_{index}@example.com',
+                password='password',
+                first_name='author',
+                last_name=str(index),
+            )
+            for index in range(3)
+        ]
+        Follow.objects.create(user=cls.user, author=authors[0])
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {index}', color=f'#00000{index}', slug=f'tag{index}'
+            )
+            for index in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {index}', measurement_unit='г'
+            )
+            for index in range(5)
+        ]
+        for index in range(RECIPES_COUNT):
+            recipe = Recipe.objects.create(
+                name=f'Рецепт {index}',
+                author=authors[index % len(authors)],
+                image='images/recipe.png',
+                text='Описание',
+                cooking_time=10,
+            )
+            recipe.tags.set(tags[:index % len(tags) + 1])
+            RecipeIngredients.objects.bulk_create(
+                RecipeIngredients(
+                    recipe=recipe, ingredient=ingredient, amount=index + 1
+                )
+                for ingredient in ingredients[:3]
+            )
+            if index % 2:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+            if index % 3:
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        cache.clear()
+
+    def count_queries(self, limit):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(RECIPES_URL, {'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), limit)
+        return len(context.captured_queries)
+
+    def test_anonymous(self):
+        self.assertEqual(self.count_queries(1), self.count_queries(100))
+
+    def test_authenticated(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.count_queries(1), self.count_queries(100))
+
+
+class SubscriptionsRecipesLimitTest(APITestCase):
+    """recipes_limit в подписках: последние рецепты авторов или 400."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, *authors = [
+            User.objects.create_user(
+                username=f'user_{index}',
+                email=f'user_{index}@example.com',
+                password='password',
+                first_name='user',
+                last_name=str(index),
+            )
+            for index in range(3)
+        ]
+        cls.latest = {}
+        for author in authors:
+            Follow.objects.create(user=cls.user, author=author)
+            recipes = [
+                Recipe.objects.create(
+                    name=f'{author.username} {index}',
+                    author=author,
+                    image='images/recipe.png',
+                    text='Описание',
+                    cooking_time=10,
+                )
+                for index in range(5)
+            ]
+            cls.latest[author.id] = [recipe.id for recipe in recipes[:-3:-1]]
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_latest_recipes(self):
+        response = self.client.get(
+            '/api/users/subscriptions/', {'recipes_limit': 2}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {
+                author['id']: [recipe['id'] for recipe in author['recipes']]
+                for author in response.data['results']
+            },
+            self.latest
+        )
+
+    def test_without_limit(self):
+        response = self.client.get('/api/users/subscriptions/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [len(author['recipes']) for author in response.data['results']],
+            [5, 5]
+        )
+
+    def test_subscribe_latest_recipes(self):
+        author_id = next(iter(self.latest))
+        Follow.objects.filter(user=self.user, author_id=author_id).delete()
+        response = self.client.post(
+            f'/api/users/{author_id}/subscribe/?recipes_limit=2'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['recipes']],
+            self.latest[author_id]
+        )
+
+    def test_invalid_limit(self):
+        for value in ('abc', '0', '-1'):
+            with self.subTest(recipes_limit=value):
+                response = self.client.get(
+                    '/api/users/subscriptions/', {'recipes_limit': value}
+                )
+                self.assertEqual(response.status_code, 400)
+
+
+class RecipeSearchCursorTest(APITestCase):
+    """С search курсор игнорируется, порядок по релевантности сохраняется."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password',
+            first_name='author',
+            last_name='author',
+        )
+        cls.in_name = Recipe.objects.create(
+            name='Красный борщ',
+            author=author,
+            image='images/recipe.png',
+            text='Описание',
+            cooking_time=10,
+        )
+        cls.in_text = Recipe.objects.create(
+            name='Суп',
+            author=author,
+            image='images/recipe.png',
+            text='Почти борщ',
+            cooking_time=10,
+        )
+
+    def test_search_with_cursor(self):
+        response = self.client.get(
+            RECIPES_URL, {'search': 'борщ', 'cursor': ''}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('count', response.data)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [self.in_name.id, self.in_text.id]
+        )
+
+
+class AsgiShoppingListStreamTest(APITestCase):
+    """Под ASGI список покупок отдаётся по частям, курсор базы не в цикле."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='buyer',
+            email='buyer@example.com',
+            password='password',
+            first_name='buyer',
+            last_name='buyer',
+        )
+        cls.token = Token.objects.create(user=cls.user)
+        cls.recipe = Recipe.objects.create(
+            name='Рецепт',
+            author=cls.user,
+            image='images/recipe.png',
+            text='Описание',
+            cooking_time=10,
+        )
+        RecipeIngredients.objects.bulk_create(
+            RecipeIngredients(
+                recipe=cls.recipe,
+                ingredient=Ingredient.objects.create(
+                    name=f'Ингредиент {index}', measurement_unit='г'
+                ),
+                amount=index + 1
+            )
+            for index in range(50)
+        )
+
+    def download(self):
+        scope = {
+            'type': 'http',
+            'method': 'GET',
+            'path': '/api/recipes/download_shopping_cart/',
+            'query_string': b'',
+            'headers': [
+                (b'host', b'testserver'),
+                (b'authorization', f'Token {self.token.key}'.encode()),
+            ],
+        }
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        # Как и тестовый клиент, не даём запросу закрыть подключение
+        # с открытой транзакцией теста.
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        try:
+            async_to_sync(StreamingASGIHandler())(scope, receive, send)
+        finally:
+            request_started.connect(close_old_connections)
+            request_finished.connect(close_old_connections)
+        return messages
+
+    def test_streamed_by_parts(self):
+        self.client.force_authenticate(self.user)
+        self.client.post(f'{RECIPES_URL}{self.recipe.id}/shopping_cart/')
+        start, *body = self.download()
+        self.assertEqual(start['status'], 200)
+        self.assertGreater(len(body), 2)
+        self.assertFalse(body[-1].get('more_body', False))
+        lines = b''.join(
+            message.get('body', b'') for message in body
+        ).splitlines()
+        self.assertEqual(len(lines), 50)
+        self.assertIn('Ингредиент 49: г, 50'.encode(), lines)
+
+
+class SharedCacheCheckTest(SimpleTestCase):
+    """Кеш в памяти процесса при нескольких воркерах - ошибка проверки."""
+
+    LOCMEM = {'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'
+    }}
+    FILE = {'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': '/tmp/foodgram_cache',
+    }}
+
+    def check_ids(self, workers, caches):
+        with override_settings(APP_WORKERS=workers, CACHES=caches):
+            return [error.id for error in check_shared_cache(None)]
+
+    def test_several_workers(self):
+        self.assertEqual(self.check_ids(4, self.LOCMEM), ['foodgram.E002'])
+
+    def test_single_worker_or_shared_cache(self):
+        self.assertEqual(self.check_ids(1, self.LOCMEM), [])
+        self.assertEqual(self.check_ids(4, self.FILE), [])
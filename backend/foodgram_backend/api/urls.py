@@ -2,8 +2,9 @@ from django.urls import include, path
 from rest_framework.routers import SimpleRouter
 
 from api.views import (
-    IngredientViewSet, RecipeViewSet, TagViewset, UserListViewSet
+    IngredientViewSet, MetricsView, RecipeViewSet, TagViewset, UserListViewSet
 )
+from utils.async_views import async_urlpatterns
 
 app_name = 'api'
 
@@ -15,6 +16,18 @@ router.register('recipes', RecipeViewSet)
 router.register('users', UserListViewSet)
 
 
+# Под ASGI эти маршруты работают как async-вьюхи, см. async_view.
+ASYNC_ROUTES = (
+    'recipe-list',
+    'recipe-detail',
+    'recipe-download-shopping-cart',
+    'tag-list',
+    'tag-detail',
+    'ingredient-list',
+    'ingredient-detail',
+)
+
 urlpatterns = [
-    path('', include(router.urls)),
+    path('_metrics', MetricsView.as_view(), name='metrics'),
+    path('', include(async_urlpatterns(router.urls, ASYNC_ROUTES))),
 ]
@@ -1,14 +1,17 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from functools import partial
+
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser import views
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.views import APIView
 
-from api.pagination import LimitedPagination
+from api.negotiation import FileFormatNegotiation
+from api.pagination import OptionalKeysetPagination, SubscriptionPagination
 from api.permissions import IsAuthorOrReadOnly, ThisUserOrAdmin
 from api.serializers import (
     CustomUserSerializer, IngredientDetailSerializer, RecipeCreateSerializer,
@@ -16,12 +19,38 @@ from api.serializers import (
     SubscriptionListSerializer, TagSerializer
 )
 from recipe.filters import IngredientFilter, RecipeFilter, TagFilter
-from recipe.models import (
-    Favorite, Ingredient, Recipe,
-    RecipeIngredients, ShoppingCart, Tag
+from recipe.ingredient_index import ingredient_index
+from recipe.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from user.models import Follow, User, attach_latest_recipes
+from utils import text_constants, views_utils
+from utils.catalog_snapshot import CatalogSnapshot
+from utils.metrics import metrics_registry
+from utils.response_cache import cached_anonymous_response
+from utils.shopping_list import (
+    SHOPPING_LIST_FORMATS, add_recipe_to_shopping_list,
+    remove_recipe_from_shopping_list, shopping_list_rows, shopping_list_stream
+)
+
+tags_snapshot = CatalogSnapshot(
+    'tags',
+    lambda: TagSerializer(Tag.objects.all(), many=True).data
 )
-from user.models import Follow, User
-from utils import views_utils, text_constants
+ingredients_snapshot = CatalogSnapshot('ingredients', ingredient_index.all)
+
+
+def get_recipes_limit(request):
+    """Параметр recipes_limit: положительное целое или None.
+
+    Некорректное значение - ValueError.
+    """
+
+    recipes_limit = request.query_params.get('recipes_limit')
+    if not recipes_limit:
+        return None
+    recipes_limit = int(recipes_limit)
+    if recipes_limit < 1:
+        raise ValueError(recipes_limit)
+    return recipes_limit
 
 
 class UserListViewSet(views.UserViewSet):
@@ -36,7 +65,9 @@ class UserListViewSet(views.UserViewSet):
     filterset_fields = ('username', 'email')
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().with_is_subscribed(
+            self.request.user
+        )
         limit = self.request.query_params.get('limit')
         if limit:
             queryset = queryset[:int(limit)]
@@ -51,10 +82,22 @@ class UserListViewSet(views.UserViewSet):
     def subscriptions(self, request):
         """Получение подписок и сериализация."""
 
-        authors = User.objects.filter(following__user=request.user)
-        paginator = PageNumberPagination()
-        paginator.page_size = 6
+        try:
+            recipes_limit = get_recipes_limit(request)
+        except ValueError:
+            return Response(
+                {'errors': text_constants.RECIPES_LIMIT_ERROR},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        authors = User.objects.filter(
+            following__user=request.user
+        ).with_is_subscribed(request.user).order_by('id')
+        if not recipes_limit:
+            authors = authors.with_recipes()
+        paginator = SubscriptionPagination()
         result_page = paginator.paginate_queryset(authors, request)
+        if recipes_limit:
+            attach_latest_recipes(result_page, recipes_limit)
         serializer = SubscriptionListSerializer(
             result_page,
             many=True,
@@ -69,35 +112,59 @@ class UserListViewSet(views.UserViewSet):
         permission_classes=(permissions.IsAuthenticated,)
     )
     def subscribe(self, request, id):
-        """Подписка на автора, отписка."""
+        """Подписка на автора, отписка.
+
+        Повторную подписку отсекает ограничение unique_user_author.
+        Ответ строится по автору, загруженному вместе с рецептами
+        до вставки, поэтому число запросов не зависит от их количества.
+        """
 
         user = request.user
-        author = get_object_or_404(User, id=id)
         if request.method == 'POST':
-            if user != author and not Follow.objects.filter(
-                user=user,
-                author=author
-            ).exists():
-                Follow.objects.create(user=request.user, author=author)
-                follows = User.objects.filter(id=id).first()
-                serializer = SubscriptionListSerializer(
-                    follows,
-                    context={'request': request}
+            try:
+                recipes_limit = get_recipes_limit(request)
+            except ValueError:
+                return Response(
+                    {'errors': text_constants.RECIPES_LIMIT_ERROR},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if recipes_limit:
+                author = get_object_or_404(User, id=id)
+                attach_latest_recipes((author,), recipes_limit)
+            else:
+                author = get_object_or_404(User.objects.with_recipes(), id=id)
+            if user == author:
+                return Response(
+                    {'errors': text_constants.SUBSCRIPTION_ERROR},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
+            try:
+                with transaction.atomic():
+                    Follow.objects.create(user=user, author=author)
+            except IntegrityError:
                 return Response(
-                    serializer.data,
-                    status=status.HTTP_201_CREATED
+                    {'errors': text_constants.SUBSCRIPTION_ERROR},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
+            author.is_subscribed = True
+            serializer = SubscriptionListSerializer(
+                author,
+                context={'request': request}
+            )
             return Response(
-                {'errors': text_constants.SUBSCRIPTION_ERROR},
-                status=status.HTTP_400_BAD_REQUEST
+                serializer.data,
+                status=status.HTTP_201_CREATED
             )
-        if user != author and Follow.objects.filter(
-            user=user,
-            author=author
-        ).exists():
-            Follow.objects.filter(user=user, author=author).delete()
+        with transaction.atomic():
+            follow = Follow.objects.select_for_update().filter(
+                user=user,
+                author_id=id
+            ).first()
+            if follow is not None:
+                follow.delete()
+        if follow is not None:
             return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(User, id=id)
         return Response(
             {'errors': text_constants.NO_ENTRY},
             status=status.HTTP_400_BAD_REQUEST
@@ -134,6 +201,14 @@ class TagViewset(viewsets.ReadOnlyModelViewSet):
     serializer_class = TagSerializer
     pagination_class = None
     filterset_class = TagFilter
+    authentication_classes = ()
+
+    def list(self, request, *args, **kwargs):
+        """Список тегов, без параметров - из готового снимка."""
+
+        if not request.query_params:
+            return tags_snapshot.response(request)
+        return super().list(request, *args, **kwargs)
 
 
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
@@ -145,6 +220,24 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
     pagination_class = None
+    authentication_classes = ()
+
+    def list(self, request, *args, **kwargs):
+        """Автодополнение по индексу ингредиентов в памяти процесса.
+
+        Совпадения по началу названия идут раньше совпадений по подстроке,
+        limit ограничивает число результатов. Без параметров отдаётся
+        готовый снимок всего справочника.
+        """
+
+        if not request.query_params:
+            return ingredients_snapshot.response(request)
+        name = request.query_params.get('name')
+        limit = request.query_params.get('limit')
+        limit = int(limit) if limit and limit.isdigit() else None
+        if name:
+            return Response(ingredient_index.search(name, limit))
+        return Response(ingredient_index.all()[:limit])
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
@@ -157,12 +250,40 @@ class RecipeViewSet(viewsets.ModelViewSet):
     )
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
-    pagination_class = LimitedPagination
+    pagination_class = OptionalKeysetPagination
+
+    def get_queryset(self):
+        """Рецепты с флагами избранного и корзины текущего пользователя.
+
+        Для списка и одного рецепта связанные данные подгружаются заранее.
+        """
+
+        if self.action in ('list', 'retrieve'):
+            return Recipe.objects.for_user(self.request.user)
+        return Recipe.objects.with_user_flags(self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        """Список рецептов, для анонимов - из кеша ответов."""
+
+        return cached_anonymous_response(
+            request,
+            'recipes',
+            partial(super().list, request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        """Один рецепт, для анонимов - из кеша ответов."""
+
+        return cached_anonymous_response(
+            request,
+            'recipes',
+            partial(super().retrieve, request, *args, **kwargs)
+        )
 
     def get_serializer_class(self):
         """Выбор сериализатора рецептов."""
 
-        if self.action in ('list', 'retrive'):
+        if self.action in ('list', 'retrieve'):
             return RecipeListSerializer
         if self.action in ('create', 'update', 'partial_update'):
             return RecipeCreateSerializer
@@ -199,42 +320,58 @@ class RecipeViewSet(viewsets.ModelViewSet):
             pk,
             ShoppingCart,
             Recipe,
-            RecipeSerializerShort
+            RecipeSerializerShort,
+            on_add=add_recipe_to_shopping_list,
+            on_remove=remove_recipe_from_shopping_list
         )
 
     @action(
         detail=False,
         methods=('get',),
-        permission_classes=(permissions.IsAuthenticated,)
+        permission_classes=(permissions.IsAuthenticated,),
+        content_negotiation_class=FileFormatNegotiation
     )
     def download_shopping_cart(self, request):
-        """Скачивание txt-файла списка покупок."""
-
-        shopping_cart = ShoppingCart.objects.filter(
-            user=request.user
-        ).values_list('recipe_id', flat=True)
-
-        ingredients = RecipeIngredients.objects.filter(
-            recipe_id__in=shopping_cart
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount')).order_by('ingredient__name')
-
-        shopping_list_content = []
-
-        for ingredient in ingredients:
-            shopping_list_content.append(
-                f'{ingredient["ingredient__name"]}:'
-                + f' {ingredient["ingredient__measurement_unit"]},'
-                + f' {ingredient["amount"]}\n'
-            )
+        """Потоковая выгрузка списка покупок в txt, csv или json.
 
-        shopping_list_string = ''.join(shopping_list_content)
-        filename = 'shopping_list.txt'
+        Параметр format задаёт формат файла, recipes - id рецептов корзины
+        через запятую, если нужен список только по части рецептов.
+        """
 
-        response = HttpResponse(
-            shopping_list_string, content_type='text/plain'
+        file_format = request.query_params.get('format', 'txt')
+        if file_format not in SHOPPING_LIST_FORMATS:
+            return Response(
+                {'errors': text_constants.SHOPPING_LIST_FORMAT_ERROR},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        recipe_ids = request.query_params.get('recipes')
+        if recipe_ids is not None:
+            try:
+                recipe_ids = [int(id) for id in recipe_ids.split(',')]
+            except ValueError:
+                return Response(
+                    {'errors': text_constants.RECIPES_PARAM_ERROR},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        rows = shopping_list_rows(request.user, recipe_ids)
+        filename = f'shopping_list.{file_format}'
+
+        response = StreamingHttpResponse(
+            shopping_list_stream(rows, file_format),
+            content_type=SHOPPING_LIST_FORMATS[file_format]
         )
         response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
+
+
+class MetricsView(APIView):
+    """Метрики эндпоинтов в формате Prometheus, только для админов."""
+
+    permission_classes = (permissions.IsAdminUser,)
+    content_negotiation_class = FileFormatNegotiation
+
+    def get(self, request):
+        return HttpResponse(
+            metrics_registry.render(),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
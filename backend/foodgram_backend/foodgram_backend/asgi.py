@@ -9,8 +9,25 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from asgiref.sync import ThreadSensitiveContext
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram_backend.settings')
+os.environ.setdefault('ASYNC_VIEWS', 'True')
 
-application = get_asgi_application()
+django.setup(set_prefix=False)
+
+from utils.async_views import StreamingASGIHandler  # noqa: E402
+
+django_application = StreamingASGIHandler()
+
+
+async def application(scope, receive, send):
+    """Каждый запрос получает свой поток для синхронных вьюх.
+
+    Django 3.2 без этого выполняет все синхронные вьюхи процесса
+    в одном общем потоке, по очереди.
+    """
+
+    async with ThreadSensitiveContext():
+        await django_application(scope, receive, send)
@@ -23,6 +23,9 @@ ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', 'localhost').split(', ')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+IMAGE_VARIANT_WORKERS = int(os.getenv('IMAGE_VARIANT_WORKERS', 2))
+IMAGE_VARIANT_QUALITY = int(os.getenv('IMAGE_VARIANT_QUALITY', 80))
+
 
 INSTALLED_APPS = [
     'django.contrib.admin',
@@ -31,6 +34,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'djoser',
@@ -45,6 +49,8 @@ INSTALLED_APPS += [
 ]
 
 MIDDLEWARE = [
+    'utils.metrics.MetricsMiddleware',
+    'utils.db_router.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,17 +81,46 @@ TEMPLATES = [
 WSGI_APPLICATION = 'foodgram_backend.wsgi.application'
 
 
+# С DB_POOL подключения берутся из пула процесса (utils.db_pool) и после
+# запроса возвращаются в него. Без пула подключение живёт CONN_MAX_AGE
+# секунд в своём потоке.
+DB_POOL = os.getenv('DB_POOL', default='True') == 'True'
+
 POSTGRES_DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': (
+            'utils.db_pool' if DB_POOL else 'django.db.backends.postgresql'
+        ),
         'NAME': os.getenv('POSTGRES_DB', 'foodgram'),
         'USER': os.getenv('POSTGRES_USER', 'django'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', 'localhost'),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        'CONN_MAX_AGE': 0 if DB_POOL else int(os.getenv('CONN_MAX_AGE', 60)),
+        'POOL': {
+            'MIN_SIZE': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+            # Не меньше ASYNC_VIEW_THREADS + 1 для ASGI-режима.
+            'MAX_SIZE': int(os.getenv('DB_POOL_MAX_SIZE', 20)),
+            'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', 5)),
+            'MAX_IDLE': float(os.getenv('DB_POOL_MAX_IDLE', 300)),
+            'MAX_LIFETIME': float(os.getenv('DB_POOL_MAX_LIFETIME', 3600)),
+            'CHECK_AFTER': float(os.getenv('DB_POOL_CHECK_AFTER', 30)),
+        },
     }
 }
 
+# Реплики только для чтения через запятую: host или host:port.
+for index, address in enumerate(
+    filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), start=1
+):
+    host, _, port = address.strip().partition(':')
+    POSTGRES_DATABASES[f'replica_{index}'] = {
+        **POSTGRES_DATABASES['default'],
+        'HOST': host,
+        'PORT': port or POSTGRES_DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
 if DEBUG:
     DATABASES = {
         'default': {
@@ -93,9 +128,50 @@ if DEBUG:
             'NAME': BASE_DIR / 'db.sqlite3',
         }
     }
+    # Вторая база в роли реплики для локальной проверки маршрутизации:
+    # её содержимое - копия db.sqlite3 на момент копирования.
+    if os.getenv('DB_SQLITE_REPLICA', default=False) == 'True':
+        DATABASES['replica'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db_replica.sqlite3',
+            'TEST': {'MIRROR': 'default'},
+        }
 else:
     DATABASES = POSTGRES_DATABASES
 
+# Безопасные запросы к API читают с реплик (utils.db_router). После
+# записи клиент DATABASE_REPLICA_PIN_SECONDS секунд читает с основной
+# базы; отметка хранится в кеше, поэтому воркерам нужен общий кеш.
+DATABASE_ROUTERS = ['utils.db_router.ReplicaRouter']
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_REPLICA_PIN_SECONDS = int(os.getenv('DB_REPLICA_PIN_SECONDS', 10))
+
+
+# Число воркеров gunicorn: он сам берёт его из WEB_CONCURRENCY. Кеш
+# в памяти процесса допустим только при одном воркере (utils.cache_checks).
+APP_WORKERS = int(os.getenv('WEB_CONCURRENCY', 1))
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+    }
+}
+
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 300))
+CATALOG_SNAPSHOT_TIMEOUT = int(os.getenv('CATALOG_SNAPSHOT_TIMEOUT', 300))
+
+# Доля запросов, по которым собираются метрики для /api/_metrics.
+METRICS_SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', 0.1))
+
+# Включается в asgi.py: часть маршрутов API работает как async-вьюхи,
+# а работа с базой идёт в пуле из ASYNC_VIEW_THREADS потоков.
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', default=False) == 'True'
+ASYNC_VIEW_THREADS = int(os.getenv('ASYNC_VIEW_THREADS', 16))
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -1,20 +1,170 @@
+from contextlib import contextmanager
+
 from django import forms
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.utils.functional import cached_property
 
 from import_export import resources
 from import_export.admin import ImportExportModelAdmin
 
 from recipe.models import (
     Favorite, Ingredient, Recipe,
-    RecipeIngredients, ShoppingCart, Tag
+    RecipeIngredients, ShoppingCart, ShoppingListItem, Tag
+)
+from utils.shopping_list import (
+    add_recipe_to_shopping_list, recipe_amounts,
+    remove_recipe_from_shopping_list, update_recipe_in_shopping_lists
 )
 
-admin.site.register(ShoppingCart)
-admin.site.register(RecipeIngredients)
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор без COUNT(*) по большой таблице без фильтров.
+
+    Для нефильтрованного списка в PostgreSQL число строк берётся из
+    статистики pg_class; для малых таблиц и фильтров считается честно.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples FROM pg_class WHERE relname = %s',
+                    (queryset.model._meta.db_table,)
+                )
+                row = cursor.fetchone()
+            if row and row[0] > ESTIMATED_COUNT_THRESHOLD:
+                return int(row[0])
+        return super().count
+
+
+class InputFilter(admin.SimpleListFilter):
+    """Фильтр с полем ввода вместо списка всех значений."""
+
+    template = 'admin/input_filter.html'
+
+    def lookups(self, request, model_admin):
+        return ((None, None),)
+
+    def choices(self, changelist):
+        all_choice = next(super().choices(changelist))
+        all_choice['query_parts'] = (
+            (key, value)
+            for key, value in changelist.get_filters_params().items()
+            if key != self.parameter_name
+        )
+        yield all_choice
+
+
+class AuthorFilter(InputFilter):
+    title = 'автору (username)'
+    parameter_name = 'author'
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(author__username=self.value())
+        return queryset
+
+
+class ScalableAdminMixin:
+    """Настройки списков для больших таблиц."""
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_select_related = True
+
+
+@admin.register(Favorite)
+class UserRecipeAdmin(ScalableAdminMixin, admin.ModelAdmin):
+    list_display = ('user', 'recipe')
+    raw_id_fields = ('user', 'recipe')
+
+
+@admin.register(ShoppingCart)
+class ShoppingCartAdmin(UserRecipeAdmin):
+    """Корзины с обновлением списков покупок пользователей."""
+
+    def save_model(self, request, obj, form, change):
+        with transaction.atomic():
+            if change:
+                old = ShoppingCart.objects.select_related(
+                    'user', 'recipe'
+                ).get(pk=obj.pk)
+                remove_recipe_from_shopping_list(old.user, old.recipe)
+            super().save_model(request, obj, form, change)
+            add_recipe_to_shopping_list(obj.user, obj.recipe)
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            remove_recipe_from_shopping_list(obj.user, obj.recipe)
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            for obj in queryset.select_related('user', 'recipe'):
+                remove_recipe_from_shopping_list(obj.user, obj.recipe)
+            super().delete_queryset(request, queryset)
+
+
+@admin.register(RecipeIngredients)
+class RecipeIngredientsAdmin(ScalableAdminMixin, admin.ModelAdmin):
+    """Ингредиенты рецептов с обновлением списков покупок."""
+
+    list_display = ('recipe', 'ingredient', 'amount')
+    raw_id_fields = ('recipe', 'ingredient')
+
+    @contextmanager
+    def shopping_lists_updated(self, recipe_ids):
+        """Учёт изменений ингредиентов рецептов внутри блока."""
+
+        with transaction.atomic():
+            old_amounts = {
+                recipe_id: recipe_amounts(recipe_id)
+                for recipe_id in set(recipe_ids)
+            }
+            yield
+            for recipe_id, amounts in old_amounts.items():
+                update_recipe_in_shopping_lists(
+                    recipe_id,
+                    amounts,
+                    recipe_amounts(recipe_id)
+                )
+
+    def save_model(self, request, obj, form, change):
+        recipe_ids = [obj.recipe_id]
+        if change:
+            recipe_ids.append(RecipeIngredients.objects.values_list(
+                'recipe_id', flat=True
+            ).get(pk=obj.pk))
+        with self.shopping_lists_updated(recipe_ids):
+            super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        with self.shopping_lists_updated((obj.recipe_id,)):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with self.shopping_lists_updated(
+            queryset.values_list('recipe_id', flat=True)
+        ):
+            super().delete_queryset(request, queryset)
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(ScalableAdminMixin, admin.ModelAdmin):
+    list_display = ('user', 'ingredient', 'amount')
+    raw_id_fields = ('user', 'ingredient')
 
 
 class FavoriteInstanceInline(admin.TabularInline):
     model = Favorite
+    raw_id_fields = ('user',)
 
 
 class AmountInline(admin.TabularInline):
@@ -23,9 +173,11 @@ class AmountInline(admin.TabularInline):
     autocomplete_fields = ('ingredient',)
 
 
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = ('name', 'author', 'display_tags', 'get_favorites_count',)
-    list_filter = ('author', 'name', 'tags')
+    list_filter = (AuthorFilter, 'tags')
+    list_select_related = ('author',)
+    autocomplete_fields = ('author',)
     fields = (
         'name',
         'author',
@@ -34,17 +186,32 @@ class RecipeAdmin(admin.ModelAdmin):
         'text',
         'cooking_time',
     )
-    search_fields = ('name', 'tags__name', 'author__username')
+    search_fields = ('name', 'author__username')
     inlines = (AmountInline, FavoriteInstanceInline)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('tags')
+
     def display_tags(self, obj):
         return ", ".join([tag.name for tag in obj.tags.all()])
 
     display_tags.short_description = 'Теги'
 
-    @admin.display(description='В избранном')
+    @admin.display(description='В избранном', ordering='favorites_count')
     def get_favorites_count(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
+
+    def save_related(self, request, form, formsets, change):
+        """Сохранение ингредиентов с обновлением списков покупок."""
+
+        old_amounts = recipe_amounts(form.instance) if change else {}
+        super().save_related(request, form, formsets, change)
+        if change:
+            update_recipe_in_shopping_lists(
+                form.instance,
+                old_amounts,
+                recipe_amounts(form.instance)
+            )
 
 
 admin.site.register(Recipe, RecipeAdmin)
@@ -63,10 +230,10 @@ class IngredientResource(resources.ModelResource):
         exclude = ('id',)
 
 
-class IngredientAdmin(ImportExportModelAdmin):
+class IngredientAdmin(ScalableAdminMixin, ImportExportModelAdmin):
     list_display = ('name', 'measurement_unit')
-    list_filter = ('name',)
-    search_fields = ('name',)
+    list_filter = ('measurement_unit',)
+    search_fields = ('^name',)
     resource_classes = (IngredientResource,)
 
 
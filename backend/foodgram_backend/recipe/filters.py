@@ -1,6 +1,12 @@
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+)
+from django.db import connections
+from django.db.models import Case, IntegerField, Q, Value, When
 from django_filters.rest_framework import FilterSet, filters
 
 from recipe.models import Ingredient, Recipe, Tag
+from utils.constants import RECIPE_SEARCH_CONFIG
 
 
 class CharInFilter(filters.BaseInFilter, filters.CharFilter):
@@ -32,10 +38,19 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.NumberFilter(
         method='filter_is_in_shopping_cart',
     )
+    search = filters.CharFilter(
+        method='filter_search',
+    )
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'author',
+            'tags',
+            'is_favorited',
+            'is_in_shopping_cart',
+            'search'
+        )
 
     def filter_is_favorited(self, queryset, _, value):
         """Проверка наличия рецепта в избранном пользователя."""
@@ -57,6 +72,40 @@ class RecipeFilter(FilterSet):
             return queryset.filter(shopping_cart__user=self.request.user)
         return queryset
 
+    def filter_search(self, queryset, _, value):
+        """Поиск рецептов по названию и описанию с ранжированием.
+
+        В PostgreSQL - полнотекстовый поиск с русской морфологией
+        и триграммное сходство названия для опечаток, оба по GIN-индексам.
+        В SQLite - поиск подстроки, совпадения в названии выше.
+        """
+
+        if connections[queryset.db].vendor == 'postgresql':
+            vector = SearchVector('name', 'text', config=RECIPE_SEARCH_CONFIG)
+            query = SearchQuery(
+                value,
+                config=RECIPE_SEARCH_CONFIG,
+                search_type='websearch'
+            )
+            return queryset.annotate(
+                search_vector=vector,
+                search_rank=(
+                    SearchRank(vector, query)
+                    + TrigramSimilarity('name', value)
+                )
+            ).filter(
+                Q(search_vector=query) | Q(name__trigram_similar=value)
+            ).order_by('-search_rank', '-pub_date', '-id')
+        return queryset.filter(
+            Q(name__icontains=value) | Q(text__icontains=value)
+        ).annotate(
+            search_rank=Case(
+                When(name__icontains=value, then=Value(1)),
+                default=Value(0),
+                output_field=IntegerField()
+            )
+        ).order_by('-search_rank', '-pub_date', '-id')
+
 
 class IngredientFilter(FilterSet):
     """Фильтр ингредиентов."""
@@ -0,0 +1,156 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image
+
+from recipe.models import Recipe
+from utils.response_cache import bump_response_cache_version
+
+logger = logging.getLogger(__name__)
+
+IMAGE_VARIANTS = {
+    'card': {'size': (480, 480), 'format': 'JPEG', 'ext': 'jpg'},
+    'detail': {'size': (1200, 1200), 'format': 'JPEG', 'ext': 'jpg'},
+    'webp': {'size': (480, 480), 'format': 'WEBP', 'ext': 'webp'},
+}
+IMAGE_VARIANTS_DIR = 'images/variants/'
+
+_executor = None
+
+
+def get_executor():
+    """Пул потоков для обработки картинок, создаётся при первом вызове."""
+
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_VARIANT_WORKERS,
+            thread_name_prefix='recipe-images'
+        )
+    return _executor
+
+
+def render_variant(image, variant):
+    """Уменьшенная и пережатая копия картинки в формате варианта."""
+
+    image = image.copy()
+    image.thumbnail(variant['size'])
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(
+        buffer,
+        variant['format'],
+        quality=settings.IMAGE_VARIANT_QUALITY,
+        optimize=True
+    )
+    return buffer.getvalue()
+
+
+def delete_image_variants(variants):
+    """Удаление файлов вариантов картинки; оригинал не трогается."""
+
+    for name, path in variants.items():
+        if name == 'source' or not path:
+            continue
+        try:
+            default_storage.delete(path)
+        except OSError:
+            logger.warning('Не удалось удалить вариант картинки %s', path)
+
+
+def make_image_variants(recipe_id, image_name):
+    """Создание вариантов картинки рецепта и запись их путей в рецепт.
+
+    Пути записываются, только если картинка рецепта не сменилась,
+    пока варианты создавались. Файлы прежних вариантов удаляются, а если
+    записать новые не удалось, удаляются они сами.
+    """
+
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    variants = {'source': image_name}
+    with default_storage.open(image_name) as file:
+        image = Image.open(file)
+        image.load()
+    for name, variant in IMAGE_VARIANTS.items():
+        variants[name] = default_storage.save(
+            f'{IMAGE_VARIANTS_DIR}{stem}_{name}.{variant["ext"]}',
+            ContentFile(render_variant(image, variant))
+        )
+    with transaction.atomic():
+        recipe = Recipe.objects.select_for_update().filter(
+            pk=recipe_id,
+            image=image_name
+        )
+        old_variants = recipe.values_list('image_variants', flat=True).first()
+        if old_variants is not None:
+            recipe.update(image_variants=variants)
+    if old_variants is None:
+        delete_image_variants(variants)
+        return None
+    bump_response_cache_version()
+    delete_image_variants({
+        name: path for name, path in old_variants.items()
+        if path not in variants.values()
+    })
+    return variants
+
+
+def _make_image_variants_task(recipe_id, image_name):
+    try:
+        make_image_variants(recipe_id, image_name)
+    except Exception:
+        logger.exception(
+            'Не удалось создать варианты картинки %s рецепта %s',
+            image_name,
+            recipe_id
+        )
+    finally:
+        close_old_connections()
+
+
+def schedule_image_variants(recipe):
+    """Постановка создания вариантов картинки в фоновый пул.
+
+    Задача запускается после коммита транзакции, в которой сохранён
+    рецепт. При IMAGE_VARIANT_WORKERS = 0 варианты создаются сразу.
+    """
+
+    recipe_id, image_name = recipe.pk, recipe.image.name
+    if not settings.IMAGE_VARIANT_WORKERS:
+        transaction.on_commit(
+            lambda: make_image_variants(recipe_id, image_name)
+        )
+        return
+    transaction.on_commit(lambda: get_executor().submit(
+        _make_image_variants_task,
+        recipe_id,
+        image_name
+    ))
+
+
+def image_variant_urls(recipe, build_url=None):
+    """Ссылки на варианты картинки рецепта.
+
+    Пока вариант не готов, вместо него отдаётся ссылка на оригинал.
+    """
+
+    if not recipe.image:
+        return None
+    variants = recipe.image_variants or {}
+    if variants.get('source') != recipe.image.name:
+        variants = {}
+    urls = {}
+    for name in IMAGE_VARIANTS:
+        url = (
+            default_storage.url(variants[name])
+            if name in variants else recipe.image.url
+        )
+        urls[name] = build_url(url) if build_url else url
+    return urls
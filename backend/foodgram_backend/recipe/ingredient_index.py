@@ -0,0 +1,98 @@
+from bisect import bisect_left
+from threading import Lock
+
+from django.core.cache import cache
+from django.db import transaction
+
+from recipe.models import Ingredient
+from utils.db_router import primary_reads
+
+INGREDIENT_INDEX_VERSION_KEY = 'ingredient_index_version'
+
+
+class IngredientIndex:
+    """Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Хранит ингредиенты, отсортированные по названию в нижнем регистре:
+    совпадения по началу названия ищутся бинарным поиском, по подстроке -
+    проходом по списку. Индекс строится при первом обращении и
+    перестраивается после изменения ингредиентов: сигналы сбрасывают
+    его в текущем процессе и меняют версию в кеше для остальных.
+    Поэтому при нескольких воркерах нужен общий кеш (foodgram.E002).
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._index = None
+
+    def _reset(self):
+        self._index = None
+        try:
+            cache.incr(INGREDIENT_INDEX_VERSION_KEY)
+        except ValueError:
+            cache.set(INGREDIENT_INDEX_VERSION_KEY, 1, None)
+
+    def invalidate(self):
+        """Сброс индекса и смена версии для других процессов.
+
+        Выполняется после коммита транзакции, иначе параллельный запрос
+        мог бы перестроить индекс по старым данным под новой версией.
+        """
+
+        transaction.on_commit(self._reset)
+
+    def _load(self):
+        """Ключи и ингредиенты текущей версии индекса."""
+
+        version = cache.get(INGREDIENT_INDEX_VERSION_KEY)
+        index = self._index
+        if index is not None and index[0] == version:
+            return index[1], index[2]
+        with self._lock:
+            index = self._index
+            if index is None or index[0] != version:
+                with primary_reads():
+                    rows = sorted(
+                        (name.lower(), id, name, measurement_unit)
+                        for id, name, measurement_unit
+                        in Ingredient.objects.values_list(
+                            'id', 'name', 'measurement_unit'
+                        )
+                    )
+                index = (
+                    version,
+                    [row[0] for row in rows],
+                    [
+                        {'id': id, 'name': name, 'measurement_unit': unit}
+                        for _, id, name, unit in rows
+                    ]
+                )
+                self._index = index
+            return index[1], index[2]
+
+    def all(self):
+        """Все ингредиенты в порядке названий."""
+
+        return self._load()[1]
+
+    def search(self, query, limit=None):
+        """Поиск по названию: сначала по началу, затем по подстроке."""
+
+        keys, items = self._load()
+        query = query.lower()
+        start = bisect_left(keys, query)
+        end = start
+        while end < len(keys) and keys[end].startswith(query):
+            end += 1
+        result = items[start:end]
+        if limit is not None and len(result) >= limit:
+            return result[:limit]
+        for position, key in enumerate(keys):
+            if query in key and not start <= position < end:
+                result.append(items[position])
+                if limit is not None and len(result) >= limit:
+                    break
+        return result
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,593 @@
+import json
+import re
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from random import Random
+from statistics import quantiles
+from threading import Event, Thread
+from time import perf_counter
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from recipe.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredients, ShoppingCart, Tag
+)
+from recipe.signals import COUNTERS
+from user.models import Follow
+from utils.counters import reconcile_counter
+from utils.response_cache import bump_response_cache_version
+from utils.shopping_list import rebuild_shopping_lists
+
+User = get_user_model()
+
+BENCH_PREFIX = 'bench'
+# Нужен только для чтения /api/_metrics и удаляется после прогона.
+BENCH_ADMIN = f'{BENCH_PREFIX}_admin'
+CART_SIZE = 5
+FOLLOWS_PER_USER = 5
+SEARCH_PREFIXES = ('а', 'мо', 'сах', 'кур', 'сыр', 'ябл', 'масл', 'пер')
+
+METRICS_LINE = re.compile(
+    r'^foodgram_db_queries_(sum|count)\{endpoint="([^"]+)",[^}]*\} (\S+)$'
+)
+PID_LINE = re.compile(r'^foodgram_worker_pid (\d+)$')
+
+
+def recipe_list(client):
+    return (('get', f'/api/recipes/?page={client.rng.randint(1, 10)}'),)
+
+
+def recipe_list_filtered(client):
+    return ((
+        'get',
+        f'/api/recipes/?tags={client.rng.choice(client.tags)}'
+        f'&author={client.rng.choice(client.authors)}'
+    ),)
+
+
+def recipe_detail(client):
+    return (('get', f'/api/recipes/{client.rng.choice(client.recipes)}/'),)
+
+
+def subscriptions(client):
+    return (('get', '/api/users/subscriptions/?recipes_limit=3'),)
+
+
+def favorite_toggle(client):
+    recipe = client.rng.choice(client.free_recipes)
+    return (
+        ('post', f'/api/recipes/{recipe}/favorite/'),
+        ('delete', f'/api/recipes/{recipe}/favorite/'),
+    )
+
+
+def cart_toggle(client):
+    recipe = client.rng.choice(client.free_recipes)
+    return (
+        ('post', f'/api/recipes/{recipe}/shopping_cart/'),
+        ('delete', f'/api/recipes/{recipe}/shopping_cart/'),
+    )
+
+
+def shopping_list(client):
+    return (('get', '/api/recipes/download_shopping_cart/'),)
+
+
+def ingredient_search(client):
+    return ((
+        'get',
+        f'/api/ingredients/?name={client.rng.choice(SEARCH_PREFIXES)}'
+    ),)
+
+
+SCENARIOS = {
+    scenario.__name__: scenario for scenario in (
+        recipe_list,
+        recipe_list_filtered,
+        recipe_detail,
+        subscriptions,
+        favorite_toggle,
+        cart_toggle,
+        shopping_list,
+        ingredient_search,
+    )
+}
+
+
+class BenchClient:
+    """Клиент одного бенчмарк-пользователя со своим генератором."""
+
+    def __init__(self, url, token, seed, dataset, cart):
+        self.url = url
+        self.rng = Random(seed)
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f'Token {token}'
+        self.recipes = dataset['recipes']
+        self.tags = dataset['tags']
+        self.authors = dataset['authors']
+        self.free_recipes = [
+            recipe for recipe in self.recipes if recipe not in cart
+        ]
+
+    def run(self, scenario, timeout):
+        """Запросы одной итерации сценария: (время, статус) на каждый.
+
+        Запрос, не уложившийся в timeout, получает статус 599.
+        """
+
+        results = []
+        for method, path in scenario(self):
+            start = perf_counter()
+            try:
+                response = self.session.request(
+                    method, self.url + path, stream=True, timeout=timeout
+                )
+                for _ in response.iter_content(65536):
+                    pass
+                status = response.status_code
+            except requests.RequestException:
+                status = 599
+            results.append((perf_counter() - start, status))
+        return results
+
+
+class SlowClient(Thread):
+    """Медленный клиент: шлёт заголовки запроса по строке раз в interval.
+
+    Пока он не дошлёт запрос, синхронный воркер занят чтением сокета,
+    а асинхронный сервер продолжает обслуживать остальных.
+    """
+
+    def __init__(self, url, interval, stop):
+        super().__init__(daemon=True)
+        self.address = urlsplit(url)
+        self.interval = interval
+        self.stop = stop
+
+    def run(self):
+        while not self.stop.is_set():
+            try:
+                with socket.create_connection(
+                    (self.address.hostname, self.address.port or 80)
+                ) as sock:
+                    sock.sendall(
+                        b'GET /api/tags/ HTTP/1.1\r\n'
+                        + f'Host: {self.address.netloc}\r\n'.encode()
+                    )
+                    while not self.stop.wait(self.interval):
+                        sock.sendall(b'X-Slow-Client: 1\r\n')
+                    sock.sendall(b'Connection: close\r\n\r\n')
+                    while sock.recv(65536):
+                        pass
+            except OSError:
+                self.stop.wait(self.interval)
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный прогон API на запущенном сервере: p50/p95/p99, '
+        'запросов в секунду и SQL-запросов на запрос по сценариям. '
+        'Результат можно сохранить как JSON-базу и сравнивать с ней.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument(
+            '--scenario',
+            action='append',
+            choices=SCENARIOS,
+            dest='scenarios',
+            help='Сценарий; можно указать несколько раз, по умолчанию все.'
+        )
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=200,
+            help='Итераций каждого сценария на всех клиентов.'
+        )
+        parser.add_argument(
+            '--recipes',
+            type=int,
+            default=200,
+            help='Минимум рецептов в базе, недостающие создаются.'
+        )
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--skip-setup',
+            action='store_true',
+            help='Не готовить данные, они остались от прошлого прогона.'
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=30,
+            help='Таймаут запроса в секундах, дольше - ошибка.'
+        )
+        parser.add_argument(
+            '--slow-clients',
+            type=int,
+            default=0,
+            help='Медленных клиентов, занимающих соединения во время прогона.'
+        )
+        parser.add_argument(
+            '--slow-interval',
+            type=float,
+            default=1,
+            help='Пауза медленного клиента между строками заголовков.'
+        )
+        parser.add_argument('--save-baseline', help='Куда сохранить JSON.')
+        parser.add_argument('--baseline', help='JSON для сравнения.')
+        parser.add_argument(
+            '--allow-create-admin',
+            action='store_true',
+            help=(
+                'Разрешить временного администратора для /api/_metrics '
+                'в базе без DEBUG.'
+            )
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.25,
+            help='Допустимое ухудшение p95 и rps относительно базы.'
+        )
+
+    def setup_dataset(self, users_count, recipes_count, seed):
+        """Бенчмарк-пользователи, недостающие рецепты, подписки и корзины.
+
+        Данные создаются bulk-операциями, поэтому счётчики, списки
+        покупок и кеш ответов приводятся в порядок в конце явно.
+        """
+
+        rng = Random(seed)
+        ingredients = list(Ingredient.objects.values_list('id', flat=True))
+        if not ingredients:
+            raise CommandError(
+                'Справочник ингредиентов пуст, сначала load_ingredients.'
+            )
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(
+                    name=f'{BENCH_PREFIX} {color}',
+                    color=color,
+                    slug=f'{BENCH_PREFIX}-{index}'
+                )
+                for index, color in enumerate(
+                    ('#E26C2D', '#49B64E', '#8775D2')
+                )
+            )
+        tags = list(Tag.objects.values_list('id', flat=True))
+        password = make_password(None)
+        User.objects.bulk_create(
+            [
+                User(
+                    username=f'{BENCH_PREFIX}_{index}',
+                    email=f'{BENCH_PREFIX}_{index}@example.com',
+                    first_name=BENCH_PREFIX,
+                    last_name=str(index),
+                    password=password,
+                )
+                for index in range(users_count)
+            ],
+            ignore_conflicts=True
+        )
+        users = self.bench_users(users_count)
+        missing = recipes_count - Recipe.objects.count()
+        if missing > 0:
+            offset = Recipe.objects.filter(
+                name__startswith=f'{BENCH_PREFIX} '
+            ).count()
+            Recipe.objects.bulk_create(
+                Recipe(
+                    name=f'{BENCH_PREFIX} {offset + index}',
+                    author=rng.choice(users),
+                    image='images/benchmark.png',
+                    text=BENCH_PREFIX,
+                    cooking_time=rng.randint(5, 120),
+                )
+                for index in range(missing)
+            )
+            recipes = Recipe.objects.filter(
+                name__startswith=f'{BENCH_PREFIX} '
+            ).order_by('-id')[:missing]
+            RecipeIngredients.objects.bulk_create(
+                RecipeIngredients(
+                    recipe=recipe,
+                    ingredient_id=ingredient,
+                    amount=rng.randint(1, 500)
+                )
+                for recipe in recipes
+                for ingredient in rng.sample(
+                    ingredients, min(len(ingredients), rng.randint(3, 10))
+                )
+            )
+            Recipe.tags.through.objects.bulk_create(
+                Recipe.tags.through(recipe_id=recipe.id, tag_id=tag)
+                for recipe in recipes
+                for tag in rng.sample(tags, rng.randint(1, len(tags)))
+            )
+        recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+        Favorite.objects.filter(user__in=users).delete()
+        ShoppingCart.objects.filter(user__in=users).delete()
+        carts = {
+            user.id: set(rng.sample(recipe_ids, CART_SIZE)) for user in users
+        }
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user_id=user_id, recipe_id=recipe_id)
+            for user_id, cart in carts.items()
+            for recipe_id in cart
+        )
+        Follow.objects.bulk_create(
+            [
+                Follow(user=user, author=author)
+                for user in users
+                for author in rng.sample(
+                    users, min(len(users), FOLLOWS_PER_USER)
+                )
+                if author != user
+            ],
+            ignore_conflicts=True
+        )
+        for related, target, foreign_key, field in COUNTERS:
+            reconcile_counter(target, related, foreign_key, field)
+        rebuild_shopping_lists([user.id for user in users])
+        bump_response_cache_version()
+        tokens = {
+            user.id: Token.objects.get_or_create(user=user)[0].key
+            for user in users
+        }
+        dataset = {
+            'recipes': recipe_ids,
+            'tags': list(Tag.objects.values_list('slug', flat=True)),
+            'authors': [user.id for user in users],
+        }
+        return [
+            (tokens[user.id], carts[user.id]) for user in users
+        ], dataset
+
+    def bench_users(self, users_count):
+        """users_count бенчмарк-пользователей без прав администратора."""
+
+        users = list(User.objects.filter(
+            username__startswith=f'{BENCH_PREFIX}_'
+        ).exclude(username=BENCH_ADMIN).order_by('id')[:users_count])
+        if len(users) < users_count:
+            raise CommandError(
+                'Бенчмарк-пользователей нет, запустите без --skip-setup.'
+            )
+        return users
+
+    def load_dataset(self, users_count):
+        users = self.bench_users(users_count)
+        tokens = {
+            token.user_id: token.key
+            for token in Token.objects.filter(user__in=users)
+        }
+        carts = {user.id: set() for user in users}
+        for user_id, recipe_id in ShoppingCart.objects.filter(
+            user__in=users
+        ).values_list('user_id', 'recipe_id'):
+            carts[user_id].add(recipe_id)
+        dataset = {
+            'recipes': list(Recipe.objects.values_list('id', flat=True)),
+            'tags': list(Tag.objects.values_list('slug', flat=True)),
+            'authors': [user.id for user in users],
+        }
+        return [
+            (tokens[user.id], carts[user.id]) for user in users
+        ], dataset
+
+    def create_admin(self):
+        """Временный администратор для /api/_metrics, его токен."""
+
+        admin, _ = User.objects.update_or_create(
+            username=BENCH_ADMIN,
+            defaults={
+                'email': f'{BENCH_ADMIN}@example.com',
+                'first_name': BENCH_PREFIX,
+                'last_name': 'admin',
+                'password': make_password(None),
+                'is_staff': True,
+            }
+        )
+        return Token.objects.get_or_create(user=admin)[0].key
+
+    def drop_admin(self):
+        """Удаление временного администратора вместе с токеном.
+
+        Прежние версии команды делали администратором bench_0,
+        такие права тоже снимаются.
+        """
+
+        User.objects.filter(username=BENCH_ADMIN).delete()
+        User.objects.filter(
+            username__startswith=f'{BENCH_PREFIX}_', is_staff=True
+        ).update(is_staff=False)
+
+    def query_totals(self, session, url):
+        """Сумма и число наблюдений SQL-запросов из /api/_metrics.
+
+        Метрики у каждого воркера свои, поэтому вместе с ними
+        возвращается pid отдавшего их процесса.
+        """
+
+        try:
+            response = session.get(url + '/api/_metrics', timeout=30)
+        except requests.RequestException:
+            return None
+        if response.status_code != 200:
+            return None
+        totals = {'sum': 0.0, 'count': 0.0, 'pid': None}
+        for line in response.text.splitlines():
+            match = METRICS_LINE.match(line)
+            if match and match.group(2) != 'api:metrics':
+                totals[match.group(1)] += float(match.group(3))
+            pid = PID_LINE.match(line)
+            if pid:
+                totals['pid'] = pid.group(1)
+        return totals
+
+    def run_scenario(self, name, clients, iterations, url, admin, timeout):
+        before = self.query_totals(admin, url)
+        scenario = SCENARIOS[name]
+        shares = [
+            iterations // len(clients) + (index < iterations % len(clients))
+            for index in range(len(clients))
+        ]
+        with ThreadPoolExecutor(len(clients)) as executor:
+            start = perf_counter()
+            results = [
+                result
+                for client_results in executor.map(
+                    lambda client, share: [
+                        result
+                        for _ in range(share)
+                        for result in client.run(scenario, timeout)
+                    ],
+                    clients,
+                    shares
+                )
+                for result in client_results
+            ]
+            elapsed = perf_counter() - start
+        after = self.query_totals(admin, url)
+        latencies = sorted(latency for latency, _ in results)
+        cuts = quantiles(latencies, n=100) if len(latencies) > 1 else (
+            latencies * 99
+        )
+        stats = {
+            'requests': len(results),
+            'errors': sum(status >= 400 for _, status in results),
+            'rps': round(len(results) / elapsed, 1),
+            'p50_ms': round(cuts[49] * 1000, 2),
+            'p95_ms': round(cuts[94] * 1000, 2),
+            'p99_ms': round(cuts[98] * 1000, 2),
+            'queries': None,
+        }
+        if before is None or after is None:
+            return stats
+        if before['pid'] != after['pid']:
+            # Метрики у каждого воркера свои: разность снимков разных
+            # процессов ничего не значит.
+            self.stderr.write(
+                f'{name}: метрики до и после отдали разные воркеры, '
+                'SQL не посчитан. Для замера SQL нужен один воркер.'
+            )
+            return stats
+        sampled = after['count'] - before['count']
+        if sampled:
+            stats['queries'] = round(
+                (after['sum'] - before['sum']) / sampled, 2
+            )
+        return stats
+
+    def compare(self, results, baseline, tolerance):
+        """Список регрессий относительно базы."""
+
+        regressions = []
+        for name, stats in results.items():
+            base = baseline.get(name)
+            if base is None:
+                continue
+            if stats['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+                regressions.append(
+                    f'{name}: p95 {stats["p95_ms"]} мс, '
+                    f'в базе {base["p95_ms"]} мс'
+                )
+            if stats['rps'] < base['rps'] * (1 - tolerance):
+                regressions.append(
+                    f'{name}: {stats["rps"]} rps, в базе {base["rps"]}'
+                )
+            if (
+                stats['queries'] is not None
+                and base.get('queries') is not None
+                and stats['queries'] > base['queries'] + 0.5
+            ):
+                regressions.append(
+                    f'{name}: {stats["queries"]} SQL на запрос, '
+                    f'в базе {base["queries"]}'
+                )
+            if stats['errors'] > base.get('errors', 0):
+                regressions.append(
+                    f'{name}: ошибок {stats["errors"]}, '
+                    f'в базе {base.get("errors", 0)}'
+                )
+        return regressions
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['allow_create_admin']:
+            raise CommandError(
+                'Команда создаёт бенчмарк-пользователей и временного '
+                'администратора в настроенной базе. Вне DEBUG нужен '
+                'явный флаг --allow-create-admin.'
+            )
+        url = options['url'].rstrip('/')
+        concurrency = options['concurrency']
+        seed = options['seed']
+        if options['skip_setup']:
+            users, dataset = self.load_dataset(concurrency)
+        else:
+            users, dataset = self.setup_dataset(
+                concurrency, options['recipes'], seed
+            )
+        clients = [
+            BenchClient(url, token, seed + index, dataset, cart)
+            for index, (token, cart) in enumerate(users)
+        ]
+        admin = requests.Session()
+        admin.headers['Authorization'] = f'Token {self.create_admin()}'
+        try:
+            results = self.run_scenarios(options, clients, url, admin)
+        finally:
+            self.drop_admin()
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as file:
+                baseline = json.load(file)
+            regressions = self.compare(
+                results, baseline, options['tolerance']
+            )
+            if regressions:
+                raise CommandError(
+                    'Регрессии относительно базы:\n' + '\n'.join(regressions)
+                )
+            self.stdout.write(self.style.SUCCESS('Регрессий нет.'))
+
+    def run_scenarios(self, options, clients, url, admin):
+        if self.query_totals(admin, url) is None:
+            self.stderr.write(
+                'Нет доступа к /api/_metrics, SQL-запросы не считаются.'
+            )
+        stop = Event()
+        for _ in range(options['slow_clients']):
+            SlowClient(url, options['slow_interval'], stop).start()
+        results = {}
+        try:
+            for name in options['scenarios'] or SCENARIOS:
+                results[name] = stats = self.run_scenario(
+                    name,
+                    clients,
+                    options['requests'],
+                    url,
+                    admin,
+                    options['timeout']
+                )
+                self.stdout.write(
+                    f'{name:22} {stats["rps"]:>8} rps  '
+                    f'p50 {stats["p50_ms"]:>8} мс  '
+                    f'p95 {stats["p95_ms"]:>8} мс  '
+                    f'p99 {stats["p99_ms"]:>8} мс  '
+                    f'SQL {stats["queries"]}  ошибок {stats["errors"]}'
+                )
+        finally:
+            stop.set()
+        return results
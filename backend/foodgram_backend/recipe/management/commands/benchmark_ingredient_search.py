@@ -0,0 +1,64 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from api.serializers import IngredientDetailSerializer
+from recipe.filters import IngredientFilter
+from recipe.ingredient_index import ingredient_index
+from recipe.models import Ingredient
+
+DEFAULT_QUERIES = (
+    'а', 'мо', 'мол', 'молоко', 'сах', 'соль', 'кур', 'яйц', 'сыр', 'ово'
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает поиск ингредиентов через IngredientFilter (icontains) '
+        'и через индекс в памяти.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'queries',
+            nargs='*',
+            default=DEFAULT_QUERIES,
+            help='Поисковые строки.'
+        )
+        parser.add_argument('--repeat', type=int, default=100)
+        parser.add_argument('--limit', type=int, default=None)
+
+    def filter_search(self, query, limit):
+        queryset = IngredientFilter(
+            {'name': query},
+            queryset=Ingredient.objects.all()
+        ).qs
+        if limit:
+            queryset = queryset[:limit]
+        return IngredientDetailSerializer(queryset, many=True).data
+
+    def measure(self, search, queries, repeat, limit):
+        start = perf_counter()
+        for _ in range(repeat):
+            for query in queries:
+                search(query, limit)
+        return (perf_counter() - start) / (repeat * len(queries)) * 1000
+
+    def handle(self, *args, **options):
+        queries = options['queries']
+        repeat = options['repeat']
+        limit = options['limit']
+        ingredient_index.all()
+        self.stdout.write(
+            f'Ингредиентов: {Ingredient.objects.count()}, '
+            f'запросов: {len(queries)}, повторов: {repeat}.'
+        )
+        for name, search in (
+            ('IngredientFilter', self.filter_search),
+            ('IngredientIndex', ingredient_index.search),
+        ):
+            self.stdout.write(
+                f'{name}: '
+                f'{self.measure(search, queries, repeat, limit):.3f} мс'
+                ' на запрос'
+            )
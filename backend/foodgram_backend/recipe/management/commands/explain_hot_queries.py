@@ -0,0 +1,113 @@
+import re
+from datetime import datetime, timezone
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipe.models import Favorite, Recipe, RecipeIngredients, ShoppingCart
+from user.models import Follow
+
+User = get_user_model()
+
+HOT_TABLES = (
+    Recipe._meta.db_table,
+    Favorite._meta.db_table,
+    ShoppingCart._meta.db_table,
+    RecipeIngredients._meta.db_table,
+    Follow._meta.db_table,
+)
+
+
+def hot_queries():
+    """Запросы, которые должны обслуживаться индексами."""
+
+    user = User(pk=1)
+    return {
+        'favorite exists': Favorite.objects.filter(
+            user_id=1, recipe_id=1
+        ).values('pk')[:1],
+        'shopping cart exists': ShoppingCart.objects.filter(
+            user_id=1, recipe_id=1
+        ).values('pk')[:1],
+        'recipe ingredients': RecipeIngredients.objects.filter(
+            recipe_id=1
+        ),
+        'recipe ingredient pair': RecipeIngredients.objects.filter(
+            recipe_id=1, ingredient_id=1
+        ),
+        'recipes page': Recipe.objects.with_user_flags(user)[:6],
+        'keyset page': Recipe.objects.filter(
+            pub_date__lte=datetime(2000, 1, 1, tzinfo=timezone.utc)
+        ).order_by('-pub_date', '-id')[:6],
+        'is_favorited filter': Recipe.objects.filter(
+            favorites__user_id=1
+        )[:6],
+        'is_in_shopping_cart filter': Recipe.objects.filter(
+            shopping_cart__user_id=1
+        )[:6],
+        'subscription exists': Follow.objects.filter(
+            user_id=1, author_id=2
+        ).values('pk')[:1],
+        'subscriptions page': User.objects.filter(
+            following__user_id=1
+        ).with_is_subscribed(user).order_by('id')[:6],
+    }
+
+
+def disable_seqscan():
+    """Запрет Seq Scan до конца текущей транзакции.
+
+    С enable_seqscan = off планировщик выбирает Seq Scan, только если
+    подходящего индекса нет, поэтому проверка не зависит от объёма
+    данных в базе.
+    """
+
+    with connection.cursor() as cursor:
+        cursor.execute('SET LOCAL enable_seqscan = off')
+
+
+def seq_scan_tables(plan):
+    """Таблицы из HOT_TABLES, которые план читает целиком."""
+
+    return [
+        table for table in HOT_TABLES
+        if re.search(rf'Seq Scan on {table}\b', plan)
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверяет планы основных запросов к рецептам, избранному, корзине, '
+        'ингредиентам рецептов и подпискам: завершается с ошибкой, если '
+        'какой-то из них читает эти таблицы целиком (Seq Scan). '
+        'Только PostgreSQL.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verbose-plans',
+            action='store_true',
+            help='Печатать планы всех запросов.'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Планы проверяются только на PostgreSQL.')
+        failed = []
+        with transaction.atomic():
+            disable_seqscan()
+            for name, queryset in hot_queries().items():
+                plan = queryset.explain()
+                seq_scans = seq_scan_tables(plan)
+                if options['verbose_plans'] or seq_scans:
+                    self.stdout.write(f'{name}:\n{plan}\n')
+                if seq_scans:
+                    failed.append(f'{name} ({", ".join(seq_scans)})')
+        if failed:
+            raise CommandError(
+                'Запросы без индекса: ' + '; '.join(failed)
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Все {len(hot_queries())} запросов используют индексы.'
+        ))
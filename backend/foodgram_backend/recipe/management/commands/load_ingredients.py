@@ -0,0 +1,115 @@
+import csv
+import json
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipe.ingredient_index import ingredient_index
+from recipe.models import Ingredient
+from utils.catalog_snapshot import invalidate_catalog_snapshot
+from utils.constants import MODELS_FIELDS_MAX_LENGTH
+from utils.response_cache import bump_response_cache_version
+
+
+def read_csv(path):
+    with open(path, encoding='utf-8', newline='') as file:
+        for row in csv.reader(file):
+            yield row[0] if row else '', row[1] if len(row) > 1 else ''
+
+
+def read_json(path):
+    with open(path, encoding='utf-8') as file:
+        for item in json.load(file):
+            yield item.get('name', ''), item.get('measurement_unit', '')
+
+
+READERS = {'.csv': read_csv, '.json': read_json}
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает справочник ингредиентов из csv (name,measurement_unit) '
+        'или json. Новые добавляются, у существующих обновляется мера; '
+        'повторный запуск ничего не меняет.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к ingredients.csv или .json.')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько строк обрабатывать за один раз.'
+        )
+
+    def load_chunk(self, rows):
+        """Добавление и обновление одной пачки строк.
+
+        Ключ - название: оно уникально, поэтому по нему же проверяется
+        и unique_ingredient. Возвращает число добавленных, обновлённых
+        и пропущенных строк.
+        """
+
+        units = {}
+        skipped = 0
+        for name, measurement_unit in rows:
+            name, measurement_unit = name.strip(), measurement_unit.strip()
+            if (
+                not name or not measurement_unit
+                or len(name) > MODELS_FIELDS_MAX_LENGTH
+                or len(measurement_unit) > MODELS_FIELDS_MAX_LENGTH
+                or name in units
+            ):
+                skipped += 1
+                continue
+            units[name] = measurement_unit
+        existing = Ingredient.objects.in_bulk(units, field_name='name')
+        new = [
+            Ingredient(name=name, measurement_unit=measurement_unit)
+            for name, measurement_unit in units.items()
+            if name not in existing
+        ]
+        changed = []
+        for name, ingredient in existing.items():
+            if ingredient.measurement_unit == units[name]:
+                skipped += 1
+                continue
+            ingredient.measurement_unit = units[name]
+            changed.append(ingredient)
+        with transaction.atomic():
+            Ingredient.objects.bulk_create(new, ignore_conflicts=True)
+            Ingredient.objects.bulk_update(changed, ('measurement_unit',))
+        return len(new), len(changed), skipped
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .csv и .json.')
+        if not path.is_file():
+            raise CommandError(f'Файл {path} не найден.')
+        inserted = updated = skipped = 0
+        for rows in chunked(reader(path), options['batch_size']):
+            chunk_inserted, chunk_updated, chunk_skipped = self.load_chunk(
+                rows
+            )
+            inserted += chunk_inserted
+            updated += chunk_updated
+            skipped += chunk_skipped
+        if inserted or updated:
+            # bulk-операции не отправляют сигналы, кеши сбрасываются здесь.
+            ingredient_index.invalidate()
+            invalidate_catalog_snapshot('ingredients')
+            bump_response_cache_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено: {inserted}, обновлено: {updated}, '
+            f'пропущено: {skipped}.'
+        ))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from recipe.images import make_image_variants
+from recipe.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт уменьшенные копии картинок рецептов, у которых их нет '
+        'или они сделаны для прежней картинки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать варианты для всех рецептов.'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='').only(
+            'id', 'image', 'image_variants'
+        )
+        done = failed = 0
+        for recipe in recipes.iterator():
+            if not options['all'] and (
+                recipe.image_variants.get('source') == recipe.image.name
+            ):
+                continue
+            try:
+                make_image_variants(recipe.pk, recipe.image.name)
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f'Рецепт {recipe.pk}: {error}')
+                continue
+            done += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {done}, с ошибками: {failed}.'
+        ))
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe.models import ShoppingListItem
+from utils.shopping_list import live_shopping_list, rebuild_shopping_lists
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает списки покупок (ShoppingListItem) по корзинам '
+        'или, с --check, только сверяет их с живым агрегатом.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить, завершиться с ошибкой при расхождении.'
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='user_ids',
+            help='id пользователя; можно указать несколько раз.'
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+        if not options['check']:
+            count = rebuild_shopping_lists(user_ids)
+            self.stdout.write(self.style.SUCCESS(
+                f'Списки покупок пересобраны, позиций: {count}.'
+            ))
+            return
+        items = ShoppingListItem.objects.all()
+        if user_ids is not None:
+            items = items.filter(user_id__in=user_ids)
+        stored = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in items.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            ).iterator()
+        }
+        live = live_shopping_list(user_ids)
+        broken_users = {
+            user_id for user_id, _ in stored.keys() ^ live.keys()
+        } | {
+            key[0] for key in stored.keys() & live.keys()
+            if stored[key] != live[key]
+        }
+        if broken_users:
+            raise CommandError(
+                'Списки покупок расходятся с корзинами у пользователей: '
+                + ', '.join(map(str, sorted(broken_users)))
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Списки покупок совпадают с корзинами, позиций: {len(live)}.'
+        ))
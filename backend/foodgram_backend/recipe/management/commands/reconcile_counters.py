@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe.signals import COUNTERS
+from utils.counters import reconcile_counter
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет счётчики избранного, корзин, рецептов и подписчиков '
+        'с настоящими COUNT и исправляет расхождения.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить, завершиться с ошибкой при расхождении.'
+        )
+
+    def handle(self, *args, **options):
+        drifted_total = 0
+        for related, target, foreign_key, field in COUNTERS:
+            drifted = reconcile_counter(
+                target,
+                related,
+                foreign_key,
+                field,
+                check=options['check']
+            )
+            drifted_total += drifted
+            self.stdout.write(
+                f'{target.__name__}.{field}: расхождений {drifted}'
+            )
+        if options['check'] and drifted_total:
+            raise CommandError('Счётчики расходятся с данными.')
+        self.stdout.write(self.style.SUCCESS('Счётчики сверены.'))
@@ -0,0 +1,386 @@
+import multiprocessing
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate
+from random import Random
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.utils import timezone
+
+from recipe.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredients, ShoppingCart, Tag
+)
+from recipe.signals import COUNTERS
+from user.models import Follow
+from utils.counters import reconcile_counter
+from utils.response_cache import bump_response_cache_version
+from utils.shopping_list import rebuild_shopping_lists
+
+User = get_user_model()
+
+DEFAULT_TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+    ('Десерт', '#D25B9A', 'dessert'),
+    ('Выпечка', '#C8A02B', 'baking'),
+    ('Салаты', '#2BA8C8', 'salads'),
+)
+WORDS = (
+    'домашний', 'быстрый', 'пряный', 'летний', 'бабушкин', 'сытный',
+    'лёгкий', 'праздничный', 'суп', 'пирог', 'салат', 'рагу', 'запеканка',
+    'омлет', 'паста', 'каша', 'курица', 'рыба', 'овощи', 'грибы', 'сыр',
+)
+USERS_PER_TASK = 2000
+RECIPES_PER_TASK = 5000
+
+# Заполняется в главном процессе до запуска воркеров, которые получают
+# его копию через fork.
+plan = {}
+
+
+class ZipfSampler:
+    """Выбор элементов с частотой, убывающей как 1 / ранг ** exponent.
+
+    Ранги раздаются после перемешивания, чтобы популярными оказались
+    не первые по id объекты.
+    """
+
+    def __init__(self, population, exponent, rng):
+        self.population = list(population)
+        rng.shuffle(self.population)
+        self.cum_weights = list(accumulate(
+            1 / rank ** exponent
+            for rank in range(1, len(self.population) + 1)
+        ))
+
+    def choice(self, rng):
+        index = bisect_left(
+            self.cum_weights, rng.random() * self.cum_weights[-1]
+        )
+        return self.population[index]
+
+    def sample(self, rng, count, exclude=None):
+        """count разных элементов, кроме exclude."""
+
+        limit = len(self.population) - (exclude is not None)
+        count = min(count, limit)
+        result = set()
+        attempts = 0
+        while len(result) < count:
+            item = self.choice(rng)
+            attempts += 1
+            if item != exclude:
+                result.add(item)
+            if attempts > count * 20:
+                # Длинный хвост почти не выпадает - добираем равномерно.
+                rest = [
+                    item for item in self.population
+                    if item != exclude and item not in result
+                ]
+                result.update(rng.sample(rest, count - len(result)))
+        return result
+
+
+def task_rng(table, index):
+    return Random(f'{plan["seed"]}-{table}-{index}')
+
+
+def per_user_counts(total, users):
+    """Раскладка total строк по пользователям почти поровну."""
+
+    base, extra = divmod(total, users)
+    return [base + (index < extra) for index in range(users)]
+
+
+def seed_recipe_links(start, stop):
+    """Ингредиенты и теги рецептов с индексами [start, stop)."""
+
+    rng = task_rng('recipe_links', start)
+    ingredients = plan['ingredients']
+    tags = plan['tags']
+    recipe_ingredients = []
+    recipe_tags = []
+    for recipe_id in plan['recipes'][start:stop]:
+        for ingredient_id in ingredients.sample(rng, rng.randint(3, 12)):
+            recipe_ingredients.append(RecipeIngredients(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=rng.choice((1, 2, 3, 5, 10, 50, 100, 200, 500))
+            ))
+        for tag_id in tags.sample(rng, rng.randint(1, 3)):
+            recipe_tags.append(Recipe.tags.through(
+                recipe_id=recipe_id,
+                tag_id=tag_id
+            ))
+    batch_size = plan['batch_size']
+    RecipeIngredients.objects.bulk_create(
+        recipe_ingredients, batch_size=batch_size
+    )
+    Recipe.tags.through.objects.bulk_create(
+        recipe_tags, batch_size=batch_size
+    )
+    return len(recipe_ingredients)
+
+
+def seed_user_links(start, stop):
+    """Подписки, избранное и корзины пользователей с индексами [start, stop).
+
+    Популярность авторов и рецептов распределена по Ципфу.
+    """
+
+    rng = task_rng('user_links', start)
+    authors = plan['authors']
+    recipes = plan['recipe_sampler']
+    follows = []
+    favorites = []
+    carts = []
+    for index in range(start, stop):
+        user_id = plan['users'][index]
+        follows.extend(
+            Follow(user_id=user_id, author_id=author_id)
+            for author_id in authors.sample(
+                rng, plan['follows'][index], exclude=user_id
+            )
+        )
+        favorites.extend(
+            Favorite(user_id=user_id, recipe_id=recipe_id)
+            for recipe_id in recipes.sample(rng, plan['favorites'][index])
+        )
+        carts.extend(
+            ShoppingCart(user_id=user_id, recipe_id=recipe_id)
+            for recipe_id in recipes.sample(rng, plan['carts'][index])
+        )
+    batch_size = plan['batch_size']
+    Follow.objects.bulk_create(follows, batch_size=batch_size)
+    Favorite.objects.bulk_create(favorites, batch_size=batch_size)
+    ShoppingCart.objects.bulk_create(carts, batch_size=batch_size)
+    return len(favorites)
+
+
+def run_task(task):
+    function, start, stop = task
+    try:
+        return function(start, stop)
+    finally:
+        connections.close_all()
+
+
+@contextmanager
+def explicit_pub_date():
+    """bulk_create с заданной pub_date вместо auto_now_add."""
+
+    field = Recipe._meta.get_field('pub_date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерирует большой синтетический набор данных: пользователей, '
+        'подписки, рецепты с ингредиентами и тегами, избранное и корзины '
+        'с популярностью по Ципфу. Результат зависит только от --seed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--recipes', type=int, default=50000)
+        parser.add_argument(
+            '--follows',
+            type=int,
+            default=20,
+            help='Подписок на пользователя в среднем.'
+        )
+        parser.add_argument(
+            '--favorites',
+            type=int,
+            default=1000000,
+            help='Всего записей избранного.'
+        )
+        parser.add_argument(
+            '--carts',
+            type=int,
+            default=50000,
+            help='Всего рецептов в корзинах.'
+        )
+        parser.add_argument(
+            '--zipf',
+            type=float,
+            default=1.1,
+            help='Показатель распределения популярности.'
+        )
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--prefix',
+            default='seed',
+            help='Префикс имён пользователей и названий рецептов.'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Процессов для связей; для SQLite всегда 1.'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def step(self, title, function, *args):
+        start = perf_counter()
+        result = function(*args)
+        self.stdout.write(f'{title}: {perf_counter() - start:.1f} с')
+        return result
+
+    def run_tasks(self, function, total, per_task, workers):
+        tasks = [
+            (function, start, min(start + per_task, total))
+            for start in range(0, total, per_task)
+        ]
+        if workers == 1:
+            return sum(map(run_task, tasks))
+        connections.close_all()
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            return sum(pool.imap_unordered(run_task, tasks))
+
+    def create_users(self, count, prefix):
+        password = make_password(None)
+        User.objects.bulk_create(
+            (
+                User(
+                    username=f'{prefix}_{index}',
+                    email=f'{prefix}_{index}@example.com',
+                    first_name=prefix,
+                    last_name=str(index),
+                    password=password,
+                )
+                for index in range(count)
+            ),
+            batch_size=plan['batch_size']
+        )
+        return list(User.objects.filter(
+            username__startswith=f'{prefix}_'
+        ).order_by('id').values_list('id', flat=True))
+
+    def create_recipes(self, count, prefix, rng, authors):
+        now = timezone.now()
+        with explicit_pub_date():
+            Recipe.objects.bulk_create(
+                (
+                    Recipe(
+                        name=f'{prefix} {index} ' + ' '.join(
+                            rng.sample(WORDS, 2)
+                        ),
+                        author_id=authors.choice(rng),
+                        image=f'images/{prefix}.png',
+                        text=' '.join(rng.choices(WORDS, k=30)),
+                        cooking_time=min(
+                            240, max(1, int(rng.lognormvariate(3.3, 0.6)))
+                        ),
+                        pub_date=now - timedelta(
+                            minutes=rng.randint(0, 60 * 24 * 365 * 3)
+                        ),
+                    )
+                    for index in range(count)
+                ),
+                batch_size=plan['batch_size']
+            )
+        return list(Recipe.objects.filter(
+            name__startswith=f'{prefix} '
+        ).order_by('id').values_list('id', flat=True))
+
+    def handle(self, *args, **options):
+        users_count = options['users']
+        recipes_count = options['recipes']
+        prefix = options['prefix']
+        workers = options['workers']
+        if users_count < 2 or recipes_count < 1:
+            raise CommandError('Нужно хотя бы 2 пользователя и 1 рецепт.')
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(
+                f'Пользователи с префиксом {prefix} уже есть, '
+                'укажите другой --prefix.'
+            )
+        ingredients = list(Ingredient.objects.values_list('id', flat=True))
+        if not ingredients:
+            raise CommandError(
+                'Справочник ингредиентов пуст, сначала load_ingredients.'
+            )
+        if connection.vendor == 'sqlite' and workers > 1:
+            self.stderr.write('SQLite не допускает параллельной записи.')
+            workers = 1
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in DEFAULT_TAGS
+            )
+        rng = Random(options['seed'])
+        plan.update(seed=options['seed'], batch_size=options['batch_size'])
+        plan['ingredients'] = ZipfSampler(
+            sorted(ingredients), options['zipf'], rng
+        )
+        plan['tags'] = ZipfSampler(
+            Tag.objects.order_by('id').values_list('id', flat=True),
+            options['zipf'],
+            rng
+        )
+        started = perf_counter()
+        plan['users'] = self.step(
+            'Пользователи', self.create_users, users_count, prefix
+        )
+        plan['authors'] = ZipfSampler(plan['users'], options['zipf'], rng)
+        plan['recipes'] = self.step(
+            'Рецепты',
+            self.create_recipes,
+            recipes_count,
+            prefix,
+            rng,
+            plan['authors']
+        )
+        plan['recipe_sampler'] = ZipfSampler(
+            plan['recipes'], options['zipf'], rng
+        )
+        plan['follows'] = [
+            rng.randint(0, 2 * options['follows']) for _ in plan['users']
+        ]
+        plan['favorites'] = per_user_counts(options['favorites'], users_count)
+        plan['carts'] = per_user_counts(options['carts'], users_count)
+        self.step(
+            'Ингредиенты и теги рецептов',
+            self.run_tasks,
+            seed_recipe_links,
+            recipes_count,
+            RECIPES_PER_TASK,
+            workers
+        )
+        self.step(
+            'Подписки, избранное и корзины',
+            self.run_tasks,
+            seed_user_links,
+            users_count,
+            USERS_PER_TASK,
+            workers
+        )
+        for related, target, foreign_key, field in COUNTERS:
+            self.step(
+                f'Счётчик {target.__name__}.{field}',
+                reconcile_counter,
+                target,
+                related,
+                foreign_key,
+                field
+            )
+        self.step('Списки покупок', rebuild_shopping_lists)
+        bump_response_cache_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {perf_counter() - started:.1f} с: '
+            f'пользователей {users_count}, рецептов {recipes_count}, '
+            f'избранного {Favorite.objects.count()}, '
+            f'в корзинах {ShoppingCart.objects.count()}, '
+            f'подписок {Follow.objects.count()}.'
+        ))
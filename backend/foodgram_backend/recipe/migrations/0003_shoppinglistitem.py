@@ -0,0 +1,52 @@
+# Generated by Django 3.2.20 on 2026-10-18 04:02
+
+from django.conf import settings
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+from recipe.migrations._helpers import rebuild_shopping_lists
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipe', '0002_alter_recipeingredients_ingredient'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='cooking_time',
+            field=models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1, 'Не меньше 1 минуты.')], verbose_name='Время приготовления в минутах'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(help_text='Загрузка картинки к рецепту', upload_to='images/', verbose_name='Картинка'),
+        ),
+        migrations.AlterField(
+            model_name='tag',
+            name='color',
+            field=models.CharField(max_length=7, unique=True, validators=[django.core.validators.RegexValidator(message='Нарушен формат ввода цвета. #RGB или #RRGGBB.', regex='^#([A-Fa-f0-9]{6}|[A-Fa-f0-9]{3})$')], verbose_name='Цвет тега'),
+        ),
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_items', to='recipe.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Позиция списка покупок',
+                'verbose_name_plural': 'Списки покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_list_item'),
+        ),
+        migrations.RunPython(rebuild_shopping_lists, migrations.RunPython.noop),
+    ]
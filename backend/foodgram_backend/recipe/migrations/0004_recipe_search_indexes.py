@@ -0,0 +1,62 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+from utils.constants import RECIPE_SEARCH_CONFIG
+
+SEARCH_INDEXES = (
+    GinIndex(
+        SearchVector('name', 'text', config=RECIPE_SEARCH_CONFIG),
+        name='recipe_search_vector_idx',
+    ),
+    GinIndex(
+        fields=('name',),
+        opclasses=('gin_trgm_ops',),
+        name='recipe_name_trgm_idx',
+    ),
+)
+
+
+class PostgresTrigramExtension(TrigramExtension):
+    """pg_trgm, откат которого на других базах ничего не делает.
+
+    В Django 3.2 CreateExtension при откате обращается к pg_extension,
+    не проверяя базу, и откат на SQLite падает.
+    """
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        super().database_backwards(
+            app_label, schema_editor, from_state, to_state
+        )
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Recipe = apps.get_model('recipe', 'Recipe')
+    for index in SEARCH_INDEXES:
+        schema_editor.add_index(Recipe, index)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Recipe = apps.get_model('recipe', 'Recipe')
+    for index in SEARCH_INDEXES:
+        schema_editor.remove_index(Recipe, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0003_shoppinglistitem'),
+    ]
+
+    operations = [
+        PostgresTrigramExtension(),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,50 @@
+from django.db import migrations
+from django.db.models import Exists, Max, OuterRef, Subquery
+
+from recipe.migrations._helpers import rebuild_shopping_lists
+
+
+def compact_recipe_ingredients(apps, schema_editor):
+    """Удаление устаревших связей рецептов с ингредиентами.
+
+    Раньше редактирование рецепта добавляло новые связи, не удаляя
+    старые, а актуальный набор ингредиентов хранился в m2m ingredients.
+    Удаляются связи с ингредиентами не из этого набора, а из повторов
+    остаётся последняя добавленная связь.
+    """
+
+    Recipe = apps.get_model('recipe', 'Recipe')
+    RecipeIngredients = apps.get_model('recipe', 'RecipeIngredients')
+    RecipeIngredientsM2M = Recipe.ingredients.through
+
+    RecipeIngredients.objects.filter(
+        Exists(RecipeIngredientsM2M.objects.filter(
+            recipe_id=OuterRef('recipe_id')
+        ))
+    ).exclude(
+        Exists(RecipeIngredientsM2M.objects.filter(
+            recipe_id=OuterRef('recipe_id'),
+            ingredient_id=OuterRef('ingredient_id')
+        ))
+    ).delete()
+    RecipeIngredients.objects.exclude(id__in=Subquery(
+        RecipeIngredients.objects.values(
+            'recipe_id', 'ingredient_id'
+        ).annotate(last_id=Max('id')).values('last_id')
+    )).delete()
+
+    rebuild_shopping_lists(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0004_recipe_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            compact_recipe_ingredients,
+            migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.20 on 2026-10-18 04:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0005_compact_recipeingredients'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Пути уменьшенных копий картинки, заполняются в фоне', verbose_name='Варианты картинки'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.2.20 on 2026-10-18 04:09
+
+from django.db import migrations, models
+
+from recipe.migrations._helpers import reconcile_counter
+
+
+def fill_recipe_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipe', 'Recipe')
+    reconcile_counter(
+        Recipe,
+        apps.get_model('recipe', 'Favorite'),
+        'recipe_id',
+        'favorites_count'
+    )
+    reconcile_counter(
+        Recipe,
+        apps.get_model('recipe', 'ShoppingCart'),
+        'recipe_id',
+        'shopping_cart_count'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0006_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В корзинах'),
+        ),
+        migrations.RunPython(fill_recipe_counters, migrations.RunPython.noop),
+    ]
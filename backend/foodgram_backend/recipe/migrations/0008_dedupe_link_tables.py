@@ -0,0 +1,53 @@
+from django.db import migrations
+from django.db.models import Min, Subquery
+
+from recipe.migrations._helpers import (
+    rebuild_shopping_lists, reconcile_counter
+)
+
+
+def delete_duplicates(model):
+    """Удаление повторов пары user-recipe, остаётся первая запись."""
+
+    deleted, _ = model.objects.exclude(id__in=Subquery(
+        model.objects.values('user_id', 'recipe_id').annotate(
+            first_id=Min('id')
+        ).values('first_id')
+    )).delete()
+    return deleted
+
+
+def dedupe_link_tables(apps, schema_editor):
+    """Подготовка к уникальным ограничениям на связи с рецептом.
+
+    Повторы в избранном и корзине могли появиться при параллельных
+    запросах. После их удаления пересчитываются счётчики рецептов
+    и, если менялась корзина, списки покупок.
+    """
+
+    Recipe = apps.get_model('recipe', 'Recipe')
+    Favorite = apps.get_model('recipe', 'Favorite')
+    ShoppingCart = apps.get_model('recipe', 'ShoppingCart')
+
+    if delete_duplicates(Favorite):
+        reconcile_counter(Recipe, Favorite, 'recipe_id', 'favorites_count')
+    if not delete_duplicates(ShoppingCart):
+        return
+    reconcile_counter(
+        Recipe,
+        ShoppingCart,
+        'recipe_id',
+        'shopping_cart_count'
+    )
+    rebuild_shopping_lists(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0007_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_link_tables, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+from django.db import migrations, models
+
+
+def drop_recipe_ingredients_m2m(apps, schema_editor):
+    """Удаление отдельной таблицы m2m рецептов и ингредиентов.
+
+    Те же пары хранятся в RecipeIngredients, которая теперь служит
+    промежуточной моделью поля Recipe.ingredients.
+    """
+
+    Recipe = apps.get_model('recipe', 'Recipe')
+    schema_editor.delete_model(Recipe.ingredients.through)
+
+
+def restore_recipe_ingredients_m2m(apps, schema_editor):
+    """Восстановление таблицы m2m по RecipeIngredients."""
+
+    Recipe = apps.get_model('recipe', 'Recipe')
+    RecipeIngredients = apps.get_model('recipe', 'RecipeIngredients')
+    RecipeIngredientsM2M = Recipe.ingredients.through
+    schema_editor.create_model(RecipeIngredientsM2M)
+    RecipeIngredientsM2M.objects.bulk_create(
+        [
+            RecipeIngredientsM2M(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id
+            )
+            for recipe_id, ingredient_id
+            in RecipeIngredients.objects.values_list(
+                'recipe_id', 'ingredient_id'
+            ).iterator()
+        ],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0010_recipe_author_pub_date_idx'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(
+                    drop_recipe_ingredients_m2m,
+                    restore_recipe_ingredients_m2m
+                ),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='recipe',
+                    name='ingredients',
+                    field=models.ManyToManyField(
+                        related_name='recipes',
+                        through='recipe.RecipeIngredients',
+                        to='recipe.Ingredient',
+                        verbose_name='Ингредиенты'
+                    ),
+                ),
+            ],
+        ),
+    ]
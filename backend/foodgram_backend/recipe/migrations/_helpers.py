@@ -0,0 +1,63 @@
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+RECONCILE_CHUNK_SIZE = 1000
+
+
+def reconcile_counter(target, related, foreign_key, field):
+    """Пересчёт счётчика field у target по COUNT связей related.
+
+    Копия utils.counters.reconcile_counter на момент миграций счётчиков:
+    изменения в utils не должны менять то, что делают старые миграции.
+    """
+
+    actual = Coalesce(
+        Subquery(
+            related.objects.filter(
+                **{foreign_key: OuterRef('pk')}
+            ).order_by().values(foreign_key).annotate(
+                count=Count('pk')
+            ).values('count')
+        ),
+        0
+    )
+    drifted = list(target.objects.annotate(
+        actual_count=actual
+    ).exclude(**{field: F('actual_count')}).values_list('pk', flat=True))
+    for start in range(0, len(drifted), RECONCILE_CHUNK_SIZE):
+        target.objects.filter(
+            pk__in=drifted[start:start + RECONCILE_CHUNK_SIZE]
+        ).update(**{field: actual})
+
+
+def rebuild_shopping_lists(apps, schema_editor=None):
+    """Пересборка списков покупок по корзинам в исторических моделях.
+
+    Повторяет utils.shopping_list.rebuild_shopping_lists, но работает
+    с моделями из apps, поэтому годится для миграций данных, в том числе
+    как функция RunPython.
+    """
+
+    ShoppingCart = apps.get_model('recipe', 'ShoppingCart')
+    ShoppingListItem = apps.get_model('recipe', 'ShoppingListItem')
+
+    ShoppingListItem.objects.all().delete()
+    rows = ShoppingCart.objects.filter(
+        recipe__recipe_ingredients__isnull=False
+    ).values_list(
+        'user_id',
+        'recipe__recipe_ingredients__ingredient_id'
+    ).annotate(
+        amount=Sum('recipe__recipe_ingredients__amount')
+    ).order_by()
+    ShoppingListItem.objects.bulk_create(
+        [
+            ShoppingListItem(
+                user_id=user_id,
+                ingredient_id=ingredient_id,
+                amount=amount
+            )
+            for user_id, ingredient_id, amount in rows
+        ],
+        batch_size=1000
+    )
@@ -1,7 +1,10 @@
 from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, RegexValidator
 from django.db import models
+from django.db.models import Exists, OuterRef, Prefetch, Value
 
+from utils.counters import CounterFieldsMixin
 from utils.constants import (
     MODELS_FIELDS_MAX_LENGTH, TAG_COLOR_MAX_LENGTH,
     TAG_NAME_MAX_LENGTH
@@ -69,9 +72,63 @@ class Ingredient(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    """Кверисет рецептов."""
+
+    def with_user_flags(self, user):
+        """Аннотация флагов избранного и корзины для пользователя.
+
+        Оба флага вычисляются в том же SQL-запросе, что и сам список,
+        подзапросами EXISTS. Для анонимного пользователя флаги равны False.
+        """
+
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False, output_field=models.BooleanField()),
+                is_in_shopping_cart=Value(
+                    False,
+                    output_field=models.BooleanField()
+                ),
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user,
+                recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user,
+                recipe=OuterRef('pk')
+            )),
+        )
+
+    def for_user(self, user):
+        """Рецепты со всеми связанными данными для сериализации.
+
+        Теги, ингредиенты и автор (с признаком подписки) загружаются
+        постоянным числом запросов, не зависящим от размера страницы.
+        """
+
+        return self.with_user_flags(user).prefetch_related(
+            'tags',
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredients.objects.select_related(
+                    'ingredient'
+                )
+            ),
+            Prefetch(
+                'author',
+                queryset=get_user_model().objects.with_is_subscribed(user)
+            ),
+        )
+
+
+class Recipe(CounterFieldsMixin, models.Model):
     """Модель рецепта."""
 
+    counter_fields = ('favorites_count', 'shopping_cart_count')
+    background_fields = ('image_variants',)
+
     name = models.CharField(
         max_length=MODELS_FIELDS_MAX_LENGTH,
         unique=True,
@@ -90,6 +147,7 @@ class Recipe(models.Model):
     )
     ingredients = models.ManyToManyField(
         Ingredient,
+        through='RecipeIngredients',
         related_name='recipes',
         verbose_name='Ингредиенты',
     )
@@ -99,6 +157,13 @@ class Recipe(models.Model):
         help_text='Загрузка картинки к рецепту',
         blank=False
     )
+    image_variants = models.JSONField(
+        verbose_name='Варианты картинки',
+        help_text='Пути уменьшенных копий картинки, заполняются в фоне',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
     text = models.TextField(
         verbose_name='Описание рецепта',
     )
@@ -110,11 +175,33 @@ class Recipe(models.Model):
         'Дата публикации рецепта',
         auto_now_add=True,
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False,
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        verbose_name='В корзинах',
+        default=0,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
+        indexes = [
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipe_author_pub_date_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -143,6 +230,12 @@ class RecipeIngredients(models.Model):
     class Meta:
         verbose_name = 'Мера(таблица m2m рецепт-ингредиент)'
         verbose_name_plural = 'Мера(таблица m2m рецепт-ингредиент)'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('recipe', 'ingredient'),
+                name='unique_recipe_ingredient',
+            )
+        ]
 
     def __str__(self):
         return self.recipe.name
@@ -162,6 +255,14 @@ class Favorite(models.Model):
         related_name='favorites'
     )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_favorite',
+            )
+        ]
+
 
 class ShoppingCart(models.Model):
     """Модель корзины."""
@@ -180,6 +281,48 @@ class ShoppingCart(models.Model):
     class Meta:
         verbose_name = 'Корзина'
         verbose_name_plural = 'Пользовательские корзины'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_shopping_cart',
+            )
+        ]
+
+    def __str__(self):
+        return self.user.username
+
+
+class ShoppingListItem(models.Model):
+    """Модель суммы ингредиента в списке покупок пользователя.
+
+    Материализованный агрегат корзины: обновляется вместе с корзиной
+    и ингредиентами рецептов, сверяется командой rebuild_shopping_lists.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент',
+    )
+    amount = models.IntegerField(
+        verbose_name='Количество',
+    )
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item',
+            )
+        ]
 
     def __str__(self):
         return self.user.username
@@ -0,0 +1,137 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete
+)
+from django.dispatch import receiver
+
+from recipe.images import delete_image_variants, schedule_image_variants
+from recipe.ingredient_index import ingredient_index
+from recipe.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredients, ShoppingCart, Tag
+)
+from user.models import Follow
+from utils.counters import change_counter
+from utils.catalog_snapshot import invalidate_catalog_snapshot
+from utils.metrics import install_query_recorder
+from utils.response_cache import bump_response_cache_version
+from utils.shopping_list import recipe_amounts, update_recipe_in_shopping_lists
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(**kwargs):
+    """Сброс индекса ингредиентов после изменения справочника."""
+
+    ingredient_index.invalidate()
+    invalidate_catalog_snapshot('ingredients')
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(**kwargs):
+    """Сброс снимка справочника тегов."""
+
+    invalidate_catalog_snapshot('tags')
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(instance, **kwargs):
+    """Создание вариантов картинки, если картинка рецепта новая."""
+
+    if instance.image and (
+        instance.image_variants.get('source') != instance.image.name
+    ):
+        schedule_image_variants(instance)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(instance, **kwargs):
+    """Вычитание рецепта из списков покупок до удаления корзин.
+
+    Срабатывает при любом удалении рецепта, в том числе каскадном при
+    удалении автора. Сигнал отправляется внутри транзакции удаления,
+    пока строки корзин и ингредиентов рецепта ещё на месте.
+    """
+
+    update_recipe_in_shopping_lists(instance, recipe_amounts(instance), {})
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(instance, **kwargs):
+    """Удаление файлов вариантов картинки после удаления рецепта."""
+
+    variants = instance.image_variants
+    if variants:
+        transaction.on_commit(lambda: delete_image_variants(variants))
+
+
+for model in (Recipe, RecipeIngredients, Tag, Ingredient):
+    post_save.connect(
+        bump_response_cache_version,
+        sender=model,
+        dispatch_uid=f'response_cache_save_{model.__name__}'
+    )
+    post_delete.connect(
+        bump_response_cache_version,
+        sender=model,
+        dispatch_uid=f'response_cache_delete_{model.__name__}'
+    )
+m2m_changed.connect(
+    bump_response_cache_version,
+    sender=Recipe.tags.through,
+    dispatch_uid='response_cache_recipe_tags'
+)
+
+
+@receiver(post_save, sender=get_user_model())
+def user_saved(update_fields=None, **kwargs):
+    """Сброс кеша ответов после изменения данных автора.
+
+    Обновление одного last_login при входе кеш не сбрасывает.
+    """
+
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        bump_response_cache_version()
+
+
+COUNTERS = (
+    (Favorite, Recipe, 'recipe_id', 'favorites_count'),
+    (ShoppingCart, Recipe, 'recipe_id', 'shopping_cart_count'),
+    (Recipe, get_user_model(), 'author_id', 'recipes_count'),
+    (Follow, get_user_model(), 'author_id', 'followers_count'),
+)
+
+
+def counter_receivers(model, target, foreign_key, field):
+    """Обработчики сигналов, поддерживающие счётчик field у target."""
+
+    def created(instance, created, **kwargs):
+        if created:
+            change_counter(target, getattr(instance, foreign_key), field, 1)
+
+    def deleted(instance, **kwargs):
+        change_counter(target, getattr(instance, foreign_key), field, -1)
+
+    post_save.connect(
+        created,
+        sender=model,
+        weak=False,
+        dispatch_uid=f'counter_created_{field}'
+    )
+    post_delete.connect(
+        deleted,
+        sender=model,
+        weak=False,
+        dispatch_uid=f'counter_deleted_{field}'
+    )
+
+
+for counter in COUNTERS:
+    counter_receivers(*counter)
+
+connection_created.connect(
+    install_query_recorder,
+    dispatch_uid='metrics_query_recorder'
+)
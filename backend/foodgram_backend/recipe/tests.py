@@ -0,0 +1,300 @@
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from rest_framework.test import APIClient
+
+from recipe.images import make_image_variants
+from recipe.management.commands.explain_hot_queries import (
+    disable_seqscan, hot_queries, seq_scan_tables
+)
+from recipe.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredients, ShoppingCart,
+    ShoppingListItem
+)
+from user.models import Follow
+from utils.shopping_list import (
+    add_recipe_to_shopping_list, live_shopping_list
+)
+
+User = get_user_model()
+
+USERS_COUNT = 50
+RECIPES_COUNT = 2000
+
+
+@skipUnless(connection.vendor == 'postgresql', 'EXPLAIN только в PostgreSQL')
+class HotQueryPlansTest(TestCase):
+    """Основные запросы обслуживаются индексами, а не Seq Scan.
+
+    Падение теста значит, что пропал индекс или запрос перестал под него
+    подходить.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.bulk_create(
+            User(
+                username=f'plan_{index}',
+                email=f'plan_{index}@example.com',
+                first_name='plan',
+                last_name=str(index),
+            )
+            for index in range(USERS_COUNT)
+        )
+        users = list(User.objects.values_list('id', flat=True))
+        Recipe.objects.bulk_create(
+            Recipe(
+                name=f'План {index}',
+                author_id=users[index % len(users)],
+                image='images/plan.png',
+                text='Описание',
+                cooking_time=10,
+            )
+            for index in range(RECIPES_COUNT)
+        )
+        recipes = list(Recipe.objects.values_list('id', flat=True))
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'План {index}', measurement_unit='г')
+            for index in range(20)
+        )
+        ingredients = list(Ingredient.objects.values_list('id', flat=True))
+        RecipeIngredients.objects.bulk_create(
+            RecipeIngredients(
+                recipe_id=recipe_id,
+                ingredient_id=ingredients[
+                    (recipe_id + shift) % len(ingredients)
+                ],
+                amount=1
+            )
+            for recipe_id in recipes
+            for shift in range(3)
+        )
+        Favorite.objects.bulk_create(
+            Favorite(user_id=user_id, recipe_id=recipe_id)
+            for user_id in users
+            for recipe_id in recipes[user_id % 7::37]
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user_id=user_id, recipe_id=recipe_id)
+            for user_id in users
+            for recipe_id in recipes[user_id % 11::97]
+        )
+        Follow.objects.bulk_create(
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id in users
+            for author_id in users[user_id % 5::9]
+            if author_id != user_id
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def test_no_seq_scans(self):
+        disable_seqscan()
+        for name, queryset in hot_queries().items():
+            with self.subTest(query=name):
+                plan = queryset.explain()
+                self.assertEqual(seq_scan_tables(plan), [], plan)
+
+
+class ImageVariantsTest(TestCase):
+    """Варианты картинки не копятся и не затираются сохранением рецепта."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.media = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        buffer = BytesIO()
+        Image.new('RGB', (64, 64), 'red').save(buffer, 'PNG')
+        self.recipe = Recipe.objects.create(
+            name='Картинка',
+            author=User.objects.create_user(
+                username='images',
+                email='images@example.com',
+                password='password',
+            ),
+            image=default_storage.save(
+                'images/recipe.png', ContentFile(buffer.getvalue())
+            ),
+            text='Описание',
+            cooking_time=10,
+        )
+
+    def variant_files(self, variants):
+        return [
+            path for name, path in variants.items()
+            if name != 'source' and default_storage.exists(path)
+        ]
+
+    def test_old_variants_deleted(self):
+        first = make_image_variants(self.recipe.pk, self.recipe.image.name)
+        second = make_image_variants(self.recipe.pk, self.recipe.image.name)
+        self.assertEqual(self.variant_files(first), [])
+        self.assertEqual(len(self.variant_files(second)), 3)
+
+    def test_save_keeps_variants(self):
+        variants = make_image_variants(
+            self.recipe.pk, self.recipe.image.name
+        )
+        self.recipe.text = 'Новое описание'
+        self.recipe.save()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_variants, variants)
+
+    def test_variants_deleted_with_recipe(self):
+        variants = make_image_variants(
+            self.recipe.pk, self.recipe.image.name
+        )
+        self.recipe.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.delete()
+        self.assertEqual(self.variant_files(variants), [])
+
+
+class ShoppingListMaintenanceTest(TestCase):
+    """Список покупок совпадает с корзиной при изменениях вне API."""
+
+    def setUp(self):
+        self.admin, self.author, self.buyer = [
+            User.objects.create_user(
+                username=username,
+                email=f'{username}@example.com',
+                password='password',
+                is_staff=username == 'admin',
+                is_superuser=username == 'admin',
+            )
+            for username in ('admin', 'author', 'buyer')
+        ]
+        ingredient = Ingredient.objects.create(
+            name='Свёкла', measurement_unit='г'
+        )
+        self.recipes = []
+        for author in (self.author, self.admin):
+            recipe = Recipe.objects.create(
+                name=f'Борщ {author.username}',
+                author=author,
+                image='images/recipe.png',
+                text='Описание',
+                cooking_time=10,
+            )
+            RecipeIngredients.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=100
+            )
+            ShoppingCart.objects.create(user=self.buyer, recipe=recipe)
+            add_recipe_to_shopping_list(self.buyer, recipe)
+            self.recipes.append(recipe)
+        self.client.force_login(self.admin)
+
+    def assertListMatchesCart(self, amount):
+        self.assertEqual(
+            {
+                (item.user_id, item.ingredient_id): item.amount
+                for item in ShoppingListItem.objects.all()
+            },
+            live_shopping_list()
+        )
+        self.assertEqual(
+            sum(self.buyer.shopping_list.values_list('amount', flat=True)),
+            amount
+        )
+
+    def test_author_deleted(self):
+        self.author.delete()
+        self.assertListMatchesCart(100)
+
+    def test_recipe_deleted_via_api(self):
+        client = APIClient()
+        client.force_authenticate(self.author)
+        response = client.delete(f'/api/recipes/{self.recipes[0].pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertListMatchesCart(100)
+
+    def test_admin_delete(self):
+        cart = ShoppingCart.objects.get(recipe=self.recipes[0])
+        response = self.client.post(
+            reverse('admin:recipe_shoppingcart_delete', args=(cart.pk,)),
+            {'post': 'yes'}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertListMatchesCart(100)
+
+    def test_admin_delete_selected(self):
+        response = self.client.post(
+            reverse('admin:recipe_shoppingcart_changelist'),
+            {
+                'action': 'delete_selected',
+                'post': 'yes',
+                '_selected_action': ShoppingCart.objects.values_list(
+                    'pk', flat=True
+                ),
+            }
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertListMatchesCart(0)
+
+    def test_admin_change_recipe_ingredient(self):
+        link = RecipeIngredients.objects.get(recipe=self.recipes[0])
+        response = self.client.post(
+            reverse(
+                'admin:recipe_recipeingredients_change', args=(link.pk,)
+            ),
+            {
+                'recipe': link.recipe_id,
+                'ingredient': link.ingredient_id,
+                'amount': 99,
+            }
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertListMatchesCart(199)
+
+    def test_admin_delete_recipe_ingredients(self):
+        response = self.client.post(
+            reverse('admin:recipe_recipeingredients_changelist'),
+            {
+                'action': 'delete_selected',
+                'post': 'yes',
+                '_selected_action': RecipeIngredients.objects.filter(
+                    recipe=self.recipes[0]
+                ).values_list('pk', flat=True),
+            }
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertListMatchesCart(100)
+
+    def test_admin_add(self):
+        recipe = Recipe.objects.create(
+            name='Салат',
+            author=self.author,
+            image='images/recipe.png',
+            text='Описание',
+            cooking_time=10,
+        )
+        RecipeIngredients.objects.create(
+            recipe=recipe,
+            ingredient=Ingredient.objects.get(),
+            amount=50
+        )
+        response = self.client.post(
+            reverse('admin:recipe_shoppingcart_add'),
+            {'user': self.buyer.pk, 'recipe': recipe.pk}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertListMatchesCart(250)
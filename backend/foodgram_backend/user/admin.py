@@ -1,12 +1,21 @@
 from django.contrib import admin
 from user.models import Follow, User
 
-admin.site.register(Follow)
+
+@admin.register(Follow)
+class FollowAdmin(admin.ModelAdmin):
+    list_display = ('user', 'author')
+    list_select_related = True
+    raw_id_fields = ('user', 'author')
+    show_full_result_count = False
 
 
 class UserAdmin(admin.ModelAdmin):
     list_display = ('username', 'email', 'first_name', 'last_name')
-    list_filter = ('username', 'email')
+    list_filter = ('is_staff', 'is_active')
+    search_fields = ('^username', '^email')
+    ordering = ('id',)
+    show_full_result_count = False
 
 
 admin.site.register(User, UserAdmin)
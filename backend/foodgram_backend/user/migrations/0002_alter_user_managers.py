@@ -0,0 +1,20 @@
+# Generated by Django 3.2.20 on 2026-10-18 03:59
+
+from django.db import migrations
+import user.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='user',
+            managers=[
+                ('objects', user.models.CustomUserManager()),
+            ],
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 3.2.20 on 2026-10-18 04:09
+
+from django.db import migrations, models
+
+from recipe.migrations._helpers import reconcile_counter
+
+
+def fill_user_counters(apps, schema_editor):
+    User = apps.get_model('user', 'User')
+    reconcile_counter(
+        User,
+        apps.get_model('recipe', 'Recipe'),
+        'author_id',
+        'recipes_count'
+    )
+    reconcile_counter(
+        User,
+        apps.get_model('user', 'Follow'),
+        'author_id',
+        'followers_count'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0002_alter_user_managers'),
+        ('recipe', '0007_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Подписчиков'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Рецептов'),
+        ),
+        migrations.RunPython(fill_user_counters, migrations.RunPython.noop),
+    ]
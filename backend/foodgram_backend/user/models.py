@@ -1,13 +1,84 @@
+from django.apps import apps
 from django.conf import settings
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.core.validators import RegexValidator
 from django.db import models
+from django.db.models import Exists, OuterRef, Prefetch, Value
 from utils.constants import USER_FIELDS_MAX_LENGTH
+from utils.counters import CounterFieldsMixin
 
 
-class User(AbstractUser):
+class UserQuerySet(models.QuerySet):
+    """Кверисет пользователей."""
+
+    def with_is_subscribed(self, user):
+        """Аннотация признака подписки пользователя на каждого автора."""
+
+        if user.is_anonymous:
+            return self.annotate(
+                is_subscribed=Value(False, output_field=models.BooleanField())
+            )
+        return self.annotate(
+            is_subscribed=Exists(Follow.objects.filter(
+                user=user,
+                author=OuterRef('pk')
+            ))
+        )
+
+    def with_recipes(self):
+        """Предзагрузка всех рецептов авторов в атрибут limited_recipes.
+
+        Для последних N рецептов - attach_latest_recipes по уже
+        загруженной странице авторов.
+        """
+
+        return self.prefetch_related(
+            Prefetch('recipes', to_attr='limited_recipes')
+        )
+
+
+def attach_latest_recipes(authors, limit):
+    """Последние limit рецептов каждого автора в author.limited_recipes.
+
+    Рецепты всех авторов выбираются одним запросом с ROW_NUMBER()
+    по индексу recipe_author_pub_date_idx. Поэтому стоимость растёт
+    линейно с числом рецептов автора, а не квадратично, как у
+    коррелированного подзапроса с LIMIT.
+    """
+
+    if not authors:
+        return
+    recipe_model = apps.get_model('recipe', 'Recipe')
+    table = recipe_model._meta.db_table
+    placeholders = ', '.join(['%s'] * len(authors))
+    recipes = recipe_model.objects.raw(
+        f'SELECT * FROM ('
+        f'SELECT {table}.*, ROW_NUMBER() OVER ('
+        f'PARTITION BY author_id ORDER BY pub_date DESC, id DESC'
+        f') AS author_row FROM {table} '
+        f'WHERE author_id IN ({placeholders})'
+        f') ranked WHERE author_row <= %s '
+        f'ORDER BY author_id, author_row',
+        [author.pk for author in authors] + [limit]
+    )
+    by_author = {author.pk: [] for author in authors}
+    for recipe in recipes:
+        by_author[recipe.author_id].append(recipe)
+    for author in authors:
+        author.limited_recipes = by_author[author.pk]
+
+
+class CustomUserManager(UserManager.from_queryset(UserQuerySet)):
+    """Менеджер пользователей с методами UserQuerySet."""
+
+    pass
+
+
+class User(CounterFieldsMixin, AbstractUser):
     """Кастомная модель пользователя."""
 
+    counter_fields = ('recipes_count', 'followers_count')
+
     email = models.EmailField(
         unique=True,
         verbose_name='Email'
@@ -31,6 +102,18 @@ class User(AbstractUser):
     password = models.CharField(
         max_length=USER_FIELDS_MAX_LENGTH,
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Подписчиков',
+        default=0,
+        editable=False,
+    )
+
+    objects = CustomUserManager()
 
 
 class Follow(models.Model):
@@ -0,0 +1,117 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.db import close_old_connections
+from django.urls import URLPattern
+
+orm_executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_VIEW_THREADS,
+    thread_name_prefix='orm'
+)
+
+
+def run_view(view, request, *args, **kwargs):
+    """Вызов синхронной вьюхи целиком в потоке пула.
+
+    Ответ рендерится здесь же. Потоковый ответ не читается: его части
+    по одной берёт StreamingASGIHandler. Подключения к базе закрываются
+    по тем же правилам, что и после обычного запроса.
+    """
+
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_view(view):
+    """Асинхронная обёртка вьюхи для ASGI.
+
+    Пока вьюха работает в ограниченном пуле orm_executor, цикл событий
+    обслуживает остальные запросы и медленных клиентов. Без ASYNC_VIEWS
+    вьюха возвращается как есть.
+    """
+
+    if not settings.ASYNC_VIEWS:
+        return view
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await sync_to_async(
+            partial(run_view, view),
+            thread_sensitive=False,
+            executor=orm_executor
+        )(request, *args, **kwargs)
+
+    return wrapper
+
+
+def async_urlpatterns(urlpatterns, names):
+    """Маршруты с именами из names переводятся на async_view."""
+
+    return [
+        URLPattern(
+            pattern.pattern,
+            async_view(pattern.callback),
+            pattern.default_args,
+            pattern.name
+        )
+        if isinstance(pattern, URLPattern) and pattern.name in names
+        else pattern
+        for pattern in urlpatterns
+    ]
+
+
+class StreamingASGIHandler(ASGIHandler):
+    """ASGIHandler, который читает потоковые ответы вне цикла событий.
+
+    Django 3.2 перебирает streaming_content прямо в цикле событий, где
+    ORM недоступна. Здесь каждая часть берётся через sync_to_async
+    в потоке запроса (ThreadSensitiveContext в asgi.py): курсор базы
+    остаётся в одном потоке, первый байт уходит сразу, а память
+    не растёт с размером ответа.
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+        response_headers = [
+            (
+                header.encode('ascii') if isinstance(header, str) else header,
+                value.encode('latin1') if isinstance(value, str) else value,
+            )
+            for header, value in response.items()
+        ]
+        for cookie in response.cookies.values():
+            response_headers.append((
+                b'Set-Cookie',
+                cookie.output(header='').encode('ascii').strip()
+            ))
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': response_headers,
+        })
+        parts = iter(response)
+        next_part = sync_to_async(next, thread_sensitive=True)
+        try:
+            while True:
+                part = await next_part(parts, None)
+                if part is None:
+                    break
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({
+                        'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': True,
+                    })
+            await send({'type': 'http.response.body'})
+        finally:
+            await sync_to_async(response.close, thread_sensitive=True)()
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core import checks
+
+# Кеши, которые не видны другим процессам: изменение, записанное одним
+# воркером, не заметит следующий запрос в другом воркере.
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+# Данные, о смене которых воркеры узнают по версии в кеше.
+SHARED_CACHE_USERS = (
+    'индекс ингредиентов',
+    'снимки тегов и ингредиентов',
+    'кеш ответов для анонимов',
+)
+
+
+def process_local_cache():
+    """Бэкенд кеша по умолчанию, если он локален для процесса, иначе None."""
+
+    backend = settings.CACHES['default']['BACKEND']
+    return backend if backend in PROCESS_LOCAL_CACHES else None
+
+
+def check_shared_cache(app_configs, **kwargs):
+    """Несколько воркеров требуют общего для них кеша.
+
+    Иначе версия, поднятая одним воркером после изменения данных,
+    не видна остальным, и они отдают устаревшие данные.
+    """
+
+    backend = process_local_cache()
+    if settings.APP_WORKERS < 2 or backend is None:
+        return []
+    return [checks.Error(
+        f'При {settings.APP_WORKERS} воркерах кеш {backend} не виден '
+        'другим процессам, поэтому после изменения данных они продолжат '
+        f'отдавать старые версии: {", ".join(SHARED_CACHE_USERS)}.',
+        hint='Задайте общий CACHE_BACKEND, например Memcached или Redis, '
+        'или запускайте один воркер (WEB_CONCURRENCY=1).',
+        id='foodgram.E002',
+    )]
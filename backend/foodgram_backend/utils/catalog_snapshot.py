@@ -0,0 +1,96 @@
+import gzip
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_http_date_safe
+from django.utils.timezone import now
+from rest_framework.renderers import JSONRenderer
+
+from utils.db_router import primary_reads
+
+
+def _version_key(name):
+    return f'catalog_snapshot_version:{name}'
+
+
+def invalidate_catalog_snapshot(name):
+    """Смена версии снимка справочника после коммита транзакции."""
+
+    def incr():
+        try:
+            cache.incr(_version_key(name))
+        except ValueError:
+            cache.set(_version_key(name), 1, None)
+
+    transaction.on_commit(incr)
+
+
+class CatalogSnapshot:
+    """Готовый ответ со всем справочником: JSON, gzip, ETag.
+
+    Снимок строится функцией build по основной базе при первом запросе
+    после смены версии и хранится в кеше CATALOG_SNAPSHOT_TIMEOUT секунд:
+    даже если воркер пропустил смену версии, старый снимок он отдаёт
+    не дольше этого срока. Запрос с совпадающим If-None-Match
+    или If-Modified-Since получает 304 без обращения к ORM.
+    """
+
+    def __init__(self, name, build):
+        self.name = name
+        self.build = build
+
+    def get(self):
+        version = cache.get_or_set(_version_key(self.name), 1, None)
+        key = f'catalog_snapshot:{self.name}:{version}'
+        snapshot = cache.get(key)
+        if snapshot is None:
+            with primary_reads():
+                data = self.build()
+            body = JSONRenderer().render(data)
+            snapshot = {
+                'body': body,
+                'gzip': gzip.compress(body),
+                'etag': f'"{md5(body).hexdigest()}"',
+                'last_modified': int(now().timestamp()),
+            }
+            cache.set(key, snapshot, settings.CATALOG_SNAPSHOT_TIMEOUT)
+        return snapshot
+
+    def is_not_modified(self, request, snapshot):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            etags = {
+                etag.strip().removeprefix('W/')
+                for etag in if_none_match.split(',')
+            }
+            return '*' in etags or snapshot['etag'] in etags
+        if_modified_since = parse_http_date_safe(
+            request.META.get('HTTP_IF_MODIFIED_SINCE', '')
+        )
+        return (
+            if_modified_since is not None
+            and snapshot['last_modified'] <= if_modified_since
+        )
+
+    def response(self, request):
+        snapshot = self.get()
+        if self.is_not_modified(request, snapshot):
+            response = HttpResponseNotModified()
+        elif 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+            response = HttpResponse(
+                snapshot['gzip'],
+                content_type='application/json'
+            )
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(
+                snapshot['body'],
+                content_type='application/json'
+            )
+        response['ETag'] = snapshot['etag']
+        response['Last-Modified'] = http_date(snapshot['last_modified'])
+        response['Vary'] = 'Accept-Encoding'
+        return response
@@ -3,3 +3,5 @@ TAG_COLOR_MAX_LENGTH = 7
 
 MODELS_FIELDS_MAX_LENGTH = 200
 USER_FIELDS_MAX_LENGTH = 150
+
+RECIPE_SEARCH_CONFIG = 'russian'
@@ -0,0 +1,70 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+RECONCILE_CHUNK_SIZE = 1000
+
+
+def change_counter(model, pk, field, delta):
+    """Атомарное изменение счётчика одним UPDATE с F-выражением."""
+
+    model.objects.filter(pk=pk).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
+
+
+def counter_subquery(related, foreign_key):
+    """Подзапрос с настоящим числом связанных строк для счётчика."""
+
+    return Coalesce(
+        Subquery(
+            related.objects.filter(
+                **{foreign_key: OuterRef('pk')}
+            ).order_by().values(foreign_key).annotate(
+                count=Count('pk')
+            ).values('count')
+        ),
+        0
+    )
+
+
+def reconcile_counter(target, related, foreign_key, field, check=False):
+    """Поиск и исправление расхождений счётчика с COUNT по связям.
+
+    Возвращает число строк target, где счётчик расходился; с check=True
+    только считает их. Миграции используют свою замороженную копию
+    из recipe/migrations/_helpers.py.
+    """
+
+    actual = counter_subquery(related, foreign_key)
+    drifted = list(target.objects.annotate(
+        actual_count=actual
+    ).exclude(**{field: F('actual_count')}).values_list('pk', flat=True))
+    if not check:
+        for start in range(0, len(drifted), RECONCILE_CHUNK_SIZE):
+            target.objects.filter(
+                pk__in=drifted[start:start + RECONCILE_CHUNK_SIZE]
+            ).update(**{field: actual})
+    return len(drifted)
+
+
+class CounterFieldsMixin:
+    """Исключение счётчиков из полного сохранения объекта.
+
+    Счётчики меняются только через change_counter, поэтому save() уже
+    существующего объекта не перезаписывает их значениями, прочитанными
+    до параллельных изменений. Так же исключаются background_fields:
+    их заполняют фоновые задачи через QuerySet.update().
+    """
+
+    counter_fields = ()
+    background_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+                and field.name not in self.background_fields
+            ]
+        super().save(*args, **kwargs)
@@ -0,0 +1,40 @@
+from django.db.backends.postgresql import base
+
+from utils.db_pool.pool import get_pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """Бэкенд PostgreSQL, который берёт подключения из пула процесса.
+
+    connect() получает подключение из пула, close() возвращает его
+    обратно. Поэтому закрытие подключения в конце запроса
+    (CONN_MAX_AGE = 0) не требует нового TCP-соединения и авторизации
+    при следующем запросе. Пул общий для всех потоков процесса: и для
+    WSGI, и для пула async_view. Параметры пула задаются в ключе POOL
+    настроек базы.
+    """
+
+    def get_new_connection(self, conn_params):
+        pool = get_pool(
+            self.alias, conn_params, self.settings_dict.get('POOL', {})
+        )
+        connection = pool.getconn()
+        options = self.settings_dict['OPTIONS']
+        self.isolation_level = options.get(
+            'isolation_level', connection.isolation_level
+        )
+        if self.isolation_level != connection.isolation_level:
+            if not connection.autocommit:
+                connection.rollback()
+            connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        # Закрытое внутри atomic подключение Django ещё держит у себя
+        # до выхода из блока, поэтому в пул его возвращать нельзя.
+        with self.wrap_database_errors:
+            self.connection.pool.putconn(
+                self.connection, discard=self.in_atomic_block
+            )
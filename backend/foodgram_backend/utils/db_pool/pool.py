@@ -0,0 +1,336 @@
+import os
+from collections import Counter
+from threading import Condition, Lock
+from time import monotonic
+
+import psycopg2
+import psycopg2.extras
+from psycopg2 import extensions
+
+from utils.metrics import (
+    SECONDS_BUCKETS, Histogram, metrics_registry, render_histogram
+)
+
+POOL_EVENTS = (
+    'checkouts', 'connects', 'timeouts', 'health_check_failures', 'recycled'
+)
+
+pools = {}
+pools_lock = Lock()
+# Пулы, унаследованные через fork. Их подключения принадлежат родителю:
+# закрытие в дочернем процессе оборвало бы его сессии на сервере.
+inherited_pools = []
+
+
+class PooledConnection(extensions.connection):
+    """Подключение psycopg2 с отметками времени для пула."""
+
+    pool = None
+    created_at = 0.0
+    released_at = 0.0
+
+
+class ConnectionPool:
+    """Потокобезопасный пул подключений к одной базе.
+
+    Свободные подключения выдаются в порядке LIFO, так что редко нужные
+    дольше простаивают и закрываются по max_idle, пока в пуле больше
+    min_size подключений. Подключение, простоявшее дольше check_after
+    секунд, перед выдачей проверяется запросом SELECT 1. Когда открыто
+    max_size подключений, getconn ждёт освобождения не дольше timeout.
+    """
+
+    def __init__(self, alias, conn_params, min_size, max_size, timeout,
+                 max_idle, max_lifetime, check_after):
+        self.alias = alias
+        self.conn_params = conn_params
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+        self.condition = Condition()
+        self.idle = []
+        self.size = 0
+        self.waiting = 0
+        self.events = Counter()
+        self.wait_seconds = Histogram(SECONDS_BUCKETS)
+
+    def connect(self):
+        connection = psycopg2.connect(
+            connection_factory=PooledConnection, **self.conn_params
+        )
+        # Как в бэкенде Django: JSON отдаётся строкой без лишнего разбора.
+        psycopg2.extras.register_default_jsonb(
+            conn_or_curs=connection, loads=lambda value: value
+        )
+        connection.pool = self
+        connection.created_at = connection.released_at = monotonic()
+        with self.condition:
+            self.events['connects'] += 1
+        return connection
+
+    def prefill(self):
+        """Открытие min_size подключений заранее."""
+
+        opened = []
+        with self.condition:
+            missing = max(self.min_size - self.size, 0)
+            self.size += missing
+        try:
+            for _ in range(missing):
+                opened.append(self.connect())
+        finally:
+            with self.condition:
+                self.size -= missing - len(opened)
+                self.idle[:0] = opened
+                self.condition.notify_all()
+
+    def getconn(self):
+        """Свободное подключение из пула или новое, если есть место."""
+
+        started = monotonic()
+        deadline = started + self.timeout
+        while True:
+            expired = []
+            try:
+                with self.condition:
+                    expired = self.collect_expired(monotonic())
+                    connection = self.acquire(deadline)
+                    self.events['checkouts'] += 1
+                    self.wait_seconds.observe(monotonic() - started)
+            finally:
+                close_quietly(expired)
+            if connection is None:
+                try:
+                    return self.connect()
+                except Exception:
+                    self.release_slot()
+                    raise
+            if self.is_usable(connection):
+                return connection
+            with self.condition:
+                self.events['health_check_failures'] += 1
+            self.putconn(connection, discard=True)
+
+    def acquire(self, deadline):
+        """Свободное подключение или None с занятым под новое местом.
+
+        Вызывается под self.condition.
+        """
+
+        while not self.idle and self.size >= self.max_size:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                self.events['timeouts'] += 1
+                raise psycopg2.OperationalError(
+                    f'Пул подключений {self.alias} исчерпан: '
+                    f'{self.size} из {self.max_size} заняты '
+                    f'дольше {self.timeout} с.'
+                )
+            self.waiting += 1
+            try:
+                self.condition.wait(remaining)
+            finally:
+                self.waiting -= 1
+        if self.idle:
+            return self.idle.pop()
+        self.size += 1
+        return None
+
+    def is_usable(self, connection):
+        """Проверка подключения перед выдачей."""
+
+        if connection.closed:
+            return False
+        if monotonic() - connection.released_at < self.check_after:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not connection.autocommit:
+                connection.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def putconn(self, connection, discard=False):
+        """Возврат подключения в пул.
+
+        Незавершённая транзакция откатывается. Сломанное или слишком
+        старое подключение закрывается.
+        """
+
+        now = monotonic()
+        if not discard:
+            discard = (
+                connection.closed
+                or now - connection.created_at >= self.max_lifetime
+            )
+        if not discard:
+            try:
+                status = connection.info.transaction_status
+                if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                    discard = True
+                elif status != extensions.TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+            except psycopg2.Error:
+                discard = True
+        if discard:
+            close_quietly([connection])
+            self.release_slot()
+            return
+        connection.released_at = now
+        with self.condition:
+            self.idle.append(connection)
+            self.condition.notify()
+
+    def release_slot(self):
+        with self.condition:
+            self.size -= 1
+            self.condition.notify()
+
+    def collect_expired(self, now):
+        """Изъятие простаивающих и старых подключений сверх min_size.
+
+        Вызывается под self.condition; закрывать возвращённые подключения
+        нужно уже без блокировки.
+        """
+
+        expired = []
+        # Первыми в списке стоят дольше всех простаивающие.
+        while self.idle and self.size > self.min_size:
+            connection = self.idle[0]
+            if (
+                now - connection.released_at < self.max_idle
+                and now - connection.created_at < self.max_lifetime
+            ):
+                break
+            expired.append(self.idle.pop(0))
+            self.size -= 1
+        self.events['recycled'] += len(expired)
+        return expired
+
+    def close(self):
+        """Закрытие всех свободных подключений."""
+
+        with self.condition:
+            idle, self.idle = self.idle, []
+            self.size -= len(idle)
+        close_quietly(idle)
+
+    def render_metrics(self):
+        """Строки метрик пула, сгруппированные по имени метрики."""
+
+        labels = f'alias="{self.alias}"'
+        with self.condition:
+            return {
+                'foodgram_db_pool_connections': [
+                    f'foodgram_db_pool_connections{{{labels},state="idle"}} '
+                    f'{len(self.idle)}',
+                    f'foodgram_db_pool_connections{{{labels},state="in_use"}} '
+                    f'{self.size - len(self.idle)}',
+                ],
+                'foodgram_db_pool_max_size': [
+                    f'foodgram_db_pool_max_size{{{labels}}} {self.max_size}'
+                ],
+                'foodgram_db_pool_waiting': [
+                    f'foodgram_db_pool_waiting{{{labels}}} {self.waiting}'
+                ],
+                'foodgram_db_pool_events_total': [
+                    f'foodgram_db_pool_events_total'
+                    f'{{{labels},event="{event}"}} {self.events[event]}'
+                    for event in POOL_EVENTS
+                ],
+                'foodgram_db_pool_wait_seconds': render_histogram(
+                    'foodgram_db_pool_wait_seconds', labels, self.wait_seconds
+                ),
+            }
+
+
+def close_quietly(connections):
+    for connection in connections:
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+
+def get_pool(alias, conn_params, options):
+    """Пул процесса для алиаса базы.
+
+    Пул пересоздаётся после fork и при смене параметров подключения
+    (например, при переходе на тестовую базу).
+    """
+
+    key = (os.getpid(), alias)
+    pool = pools.get(key)
+    if pool is not None and pool.conn_params == conn_params:
+        return pool
+    with pools_lock:
+        pool = pools.get(key)
+        if pool is not None and pool.conn_params == conn_params:
+            return pool
+        if pool is not None:
+            pool.close()
+        for stale_key in [key for key in pools if key[0] != os.getpid()]:
+            inherited_pools.append(pools.pop(stale_key))
+        pool = ConnectionPool(
+            alias,
+            conn_params,
+            min_size=options.get('MIN_SIZE', 0),
+            max_size=options.get('MAX_SIZE', 10),
+            timeout=options.get('TIMEOUT', 5),
+            max_idle=options.get('MAX_IDLE', 300),
+            max_lifetime=options.get('MAX_LIFETIME', 3600),
+            check_after=options.get('CHECK_AFTER', 30),
+        )
+        pools[key] = pool
+    pool.prefill()
+    return pool
+
+
+def close_pools():
+    """Закрытие свободных подключений всех пулов процесса."""
+
+    for (pid, alias), pool in list(pools.items()):
+        if pid == os.getpid():
+            pool.close()
+
+
+def render_pool_metrics():
+    """Заполненность пулов и время ожидания подключения для /api/_metrics."""
+
+    metrics = {
+        'foodgram_db_pool_connections': (
+            'gauge', 'Подключения пула по состоянию.'
+        ),
+        'foodgram_db_pool_max_size': (
+            'gauge', 'Предельный размер пула.'
+        ),
+        'foodgram_db_pool_waiting': (
+            'gauge', 'Потоки, ждущие свободного подключения.'
+        ),
+        'foodgram_db_pool_events_total': (
+            'counter', 'Выдачи, новые подключения, таймауты и проверки.'
+        ),
+        'foodgram_db_pool_wait_seconds': (
+            'histogram', 'Ожидание подключения из пула.'
+        ),
+    }
+    rendered = [
+        pool.render_metrics()
+        for (pid, alias), pool in sorted(pools.items())
+        if pid == os.getpid()
+    ]
+    lines = []
+    for name, (metric_type, help_text) in metrics.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for pool_lines in rendered:
+            lines.extend(pool_lines[name])
+    return lines
+
+
+metrics_registry.add_collector(render_pool_metrics)
@@ -0,0 +1,165 @@
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from hashlib import md5
+from random import choice
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+from utils.cache_checks import process_local_cache
+
+PRIMARY_PIN_KEY = 'db_primary_pin'
+API_PREFIX = '/api/'
+# Токены читаются только с основной базы: токен, выданный при входе,
+# может ещё не дойти до реплики к следующему запросу.
+PRIMARY_ONLY_APPS = {'authtoken', 'sessions'}
+
+current_route = ContextVar('current_db_route', default=None)
+
+
+def primary_pin_key(request):
+    """Ключ закрепления за основной базой по токену или сессии клиента."""
+
+    credentials = request.META.get('HTTP_AUTHORIZATION') or (
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    if not credentials:
+        return None
+    return f'{PRIMARY_PIN_KEY}:{md5(credentials.encode()).hexdigest()}'
+
+
+class RequestRoute:
+    """Выбор базы для чтения в рамках одного запроса.
+
+    Безопасные запросы к API читают с одной случайной реплики, если
+    клиент не закреплён за основной базой. Закрепление проверяется
+    в кеше при первом чтении, а ставится при первой записи и действует
+    DATABASE_REPLICA_PIN_SECONDS: за это время реплика успевает
+    получить изменения, и клиент не увидит, например, старый
+    is_favorited.
+    """
+
+    def __init__(self, request):
+        self.pin_key = primary_pin_key(request)
+        self.replica = None
+        self.checked = False
+        if (
+            request.method in SAFE_METHODS
+            and request.path.startswith(API_PREFIX)
+        ):
+            self.replica = choice(settings.DATABASE_REPLICAS)
+
+    def db_for_read(self):
+        if self.replica is not None and not self.checked:
+            self.checked = True
+            if self.pin_key and cache.get(self.pin_key):
+                self.replica = None
+        return self.replica or DEFAULT_DB_ALIAS
+
+    def wrote(self):
+        """Запись: дальше запрос и клиент читают с основной базы."""
+
+        self.replica = None
+        if self.pin_key:
+            cache.set(
+                self.pin_key, True, settings.DATABASE_REPLICA_PIN_SECONDS
+            )
+            self.pin_key = None
+
+
+@contextmanager
+def primary_reads():
+    """Чтение с основной базы внутри блока.
+
+    Нужно там, где результат кешируется: отставшая реплика не должна
+    попасть в кеш под новой версией.
+    """
+
+    token = current_route.set(None)
+    try:
+        yield
+    finally:
+        current_route.reset(token)
+
+
+def check_replica_pin_cache(app_configs, **kwargs):
+    """Закрепление за основной базой требует общего для воркеров кеша.
+
+    С локальным кешем процесса это ошибка. В DEBUG - предупреждение:
+    runserver работает в одном процессе.
+    """
+
+    backend = process_local_cache()
+    if not settings.DATABASE_REPLICAS or backend is None:
+        return []
+    if settings.DEBUG:
+        level, check_id = checks.Warning, 'foodgram.W001'
+    else:
+        level, check_id = checks.Error, 'foodgram.E001'
+    return [level(
+        f'При репликах {", ".join(settings.DATABASE_REPLICAS)} кеш '
+        f'{backend} не годится для закрепления за основной базой: другие '
+        'воркеры его не видят и читают с отставшей реплики.',
+        hint='Задайте общий CACHE_BACKEND, например Memcached или Redis.',
+        id=check_id,
+    )]
+
+
+class ReplicaRouter:
+    """Чтение с реплик по маршруту текущего запроса, запись в основную.
+
+    Вне запроса (команды, миграции, сигналы после записи) всё идёт
+    в основную базу.
+    """
+
+    def db_for_read(self, model, **hints):
+        route = current_route.get()
+        if route is None or model._meta.app_label in PRIMARY_ONLY_APPS:
+            return DEFAULT_DB_ALIAS
+        return route.db_for_read()
+
+    def db_for_write(self, model, **hints):
+        route = current_route.get()
+        if route is not None:
+            route.wrote()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная база.
+        return True
+
+
+class ReplicaRoutingMiddleware:
+    """Маршрут чтения для запроса, если настроены реплики."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        token = current_route.set(RequestRoute(request))
+        try:
+            return self.get_response(request)
+        finally:
+            current_route.reset(token)
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+        token = current_route.set(RequestRoute(request))
+        try:
+            return await self.get_response(request)
+        finally:
+            current_route.reset(token)
@@ -0,0 +1,259 @@
+import asyncio
+import os
+from bisect import bisect_left
+from contextvars import ContextVar
+from random import random
+from threading import Lock
+from time import perf_counter
+
+from django.conf import settings
+
+from utils.response_cache import response_cache_stats
+
+SECONDS_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+QUERIES_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+
+HISTOGRAMS = {
+    'foodgram_request_seconds': (
+        'Время обработки запроса.', SECONDS_BUCKETS
+    ),
+    'foodgram_db_queries': (
+        'Число SQL-запросов за запрос.', QUERIES_BUCKETS
+    ),
+    'foodgram_db_seconds': (
+        'Время SQL-запросов за запрос.', SECONDS_BUCKETS
+    ),
+    'foodgram_serialization_seconds': (
+        'Время сериализации ответа.', SECONDS_BUCKETS
+    ),
+}
+
+HTTP_METHODS = {'GET', 'HEAD', 'OPTIONS', 'POST', 'PUT', 'PATCH', 'DELETE'}
+
+current_request_stats = ContextVar('current_request_stats', default=None)
+
+
+class RequestStats:
+    """Счётчики одного запроса, попавшего в выборку."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serialization_seconds = 0.0
+        self.serializing = False
+
+    def execute(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_seconds += perf_counter() - start
+
+
+class Histogram:
+    """Гистограмма в формате Prometheus: накопительные корзины."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def render_histogram(name, labels, histogram):
+    """Строки одной гистограммы: корзины, сумма и число наблюдений."""
+
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+    return lines
+
+
+class MetricsRegistry:
+    """Гистограммы по эндпоинтам в памяти процесса."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.histograms = {}
+        self.collectors = []
+
+    def add_collector(self, collector):
+        """collector() возвращает дополнительные строки для render."""
+
+        self.collectors.append(collector)
+
+    def observe(self, endpoint, method, stats, seconds):
+        values = {
+            'foodgram_request_seconds': seconds,
+            'foodgram_db_queries': stats.queries,
+            'foodgram_db_seconds': stats.db_seconds,
+            'foodgram_serialization_seconds': stats.serialization_seconds,
+        }
+        with self.lock:
+            for name, value in values.items():
+                key = (name, endpoint, method)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(HISTOGRAMS[name][1])
+                self.histograms[key].observe(value)
+
+    def render(self):
+        """Текст всех метрик в формате Prometheus 0.0.4."""
+
+        lines = []
+        with self.lock:
+            for name, (help_text, buckets) in HISTOGRAMS.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for (metric, endpoint, method), histogram in sorted(
+                    self.histograms.items()
+                ):
+                    if metric == name:
+                        lines.extend(render_histogram(
+                            name,
+                            f'endpoint="{endpoint}",method="{method}"',
+                            histogram
+                        ))
+        lines.append(
+            '# HELP foodgram_response_cache_total '
+            'Обращения к кешу ответов для анонимов.'
+        )
+        lines.append('# TYPE foodgram_response_cache_total counter')
+        for result in ('hits', 'misses'):
+            lines.append(
+                f'foodgram_response_cache_total{{result="{result}"}} '
+                f'{response_cache_stats[result]}'
+            )
+        # Метрики хранятся в памяти процесса: по pid видно, что два
+        # снимка /api/_metrics получены от разных воркеров.
+        lines.append('# HELP foodgram_worker_pid Процесс, отдавший метрики.')
+        lines.append('# TYPE foodgram_worker_pid gauge')
+        lines.append(f'foodgram_worker_pid {os.getpid()}')
+        for collector in self.collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+
+metrics_registry = MetricsRegistry()
+
+
+def endpoint_name(request):
+    """Имя эндпоинта для метки.
+
+    Вьюсеты DRF подписываются как Класс.action, остальные вьюхи - именем
+    маршрута.
+    """
+
+    match = request.resolver_match
+    if match is None:
+        return 'unresolved'
+    if match.app_name == 'admin':
+        return 'admin'
+    actions = getattr(match.func, 'actions', None)
+    if actions:
+        action = actions.get(request.method.lower(), 'other')
+        return f'{match.func.cls.__name__}.{action}'
+    return match.view_name
+
+
+def record_query(execute, sql, params, many, context):
+    """Обёртка подключения: учёт запроса, если запрос попал в выборку.
+
+    Статистика запроса берётся из контекстной переменной, поэтому учёт
+    работает и в потоках, куда ASGI и async_view выносят работу с базой.
+    """
+
+    stats = current_request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats.execute(execute, sql, params, many, context)
+
+
+def install_query_recorder(connection, **kwargs):
+    """Подключение record_query к новому подключению к базе."""
+
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+class MetricsMiddleware:
+    """Сбор метрик для доли запросов, заданной METRICS_SAMPLE_RATE.
+
+    Для запроса из выборки считаются время, число и время SQL-запросов
+    (record_query) и время сериализации (SerializationMetricsMixin).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if random() >= settings.METRICS_SAMPLE_RATE:
+            return self.get_response(request)
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        start = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request_stats.reset(token)
+        self.observe(request, stats, perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        if random() >= settings.METRICS_SAMPLE_RATE:
+            return await self.get_response(request)
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        start = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request_stats.reset(token)
+        self.observe(request, stats, perf_counter() - start)
+        return response
+
+    def observe(self, request, stats, seconds):
+        metrics_registry.observe(
+            endpoint_name(request),
+            request.method if request.method in HTTP_METHODS else 'OTHER',
+            stats,
+            seconds
+        )
+
+
+class SerializationMetricsMixin:
+    """Учёт времени to_representation в метриках текущего запроса.
+
+    Считается только внешний сериализатор: вложенные выполняются
+    внутри его to_representation.
+    """
+
+    def to_representation(self, instance):
+        stats = current_request_stats.get()
+        if stats is None or stats.serializing:
+            return super().to_representation(instance)
+        stats.serializing = True
+        start = perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            stats.serializing = False
+            stats.serialization_seconds += perf_counter() - start
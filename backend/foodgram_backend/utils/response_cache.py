@@ -0,0 +1,79 @@
+from collections import Counter
+from hashlib import md5
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+from utils.db_router import primary_reads
+
+RESPONSE_CACHE_VERSION_KEY = 'recipe_response_cache_version'
+
+response_cache_stats = Counter()
+
+
+def get_response_cache_version():
+    """Текущая версия кеша ответов."""
+
+    return cache.get_or_set(RESPONSE_CACHE_VERSION_KEY, 1, None)
+
+
+def _incr_response_cache_version():
+    try:
+        cache.incr(RESPONSE_CACHE_VERSION_KEY)
+    except ValueError:
+        cache.set(RESPONSE_CACHE_VERSION_KEY, 1, None)
+
+
+def bump_response_cache_version(**kwargs):
+    """Смена версии: все закешированные ответы становятся устаревшими.
+
+    Версия меняется после коммита транзакции, чтобы параллельный запрос
+    не закешировал старые данные под новой версией. Другие воркеры видят
+    новую версию только через общий кеш, это проверяет foodgram.E002.
+    Подключается к сигналам моделей, поэтому принимает любые kwargs.
+    """
+
+    transaction.on_commit(_incr_response_cache_version)
+
+
+def response_cache_key(request, prefix):
+    """Ключ кеша по хосту, пути и упорядоченным параметрам запроса."""
+
+    params = urlencode(sorted(
+        (name, value)
+        for name, values in request.query_params.lists()
+        for value in values
+        if value
+    ))
+    raw = f'{request.get_host()}{request.path}?{params}'
+    return (
+        f'{prefix}:{get_response_cache_version()}:'
+        f'{md5(raw.encode()).hexdigest()}'
+    )
+
+
+def cached_anonymous_response(request, prefix, get_response):
+    """Ответ из кеша для анонимного GET-запроса.
+
+    При промахе ответ строится get_response по основной базе и
+    кешируется, если он успешный. Авторизованные запросы кеш
+    не используют.
+    """
+
+    if not request.user.is_anonymous or request.method != 'GET':
+        return get_response()
+    key = response_cache_key(request, prefix)
+    data = cache.get(key)
+    if data is not None:
+        response_cache_stats['hits'] += 1
+        return Response(data, headers={'X-Cache': 'HIT'})
+    response_cache_stats['misses'] += 1
+    with primary_reads():
+        response = get_response()
+    if response.status_code == 200:
+        cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+    response['X-Cache'] = 'MISS'
+    return response
@@ -0,0 +1,212 @@
+import csv
+import json
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+
+from recipe.models import RecipeIngredients, ShoppingCart, ShoppingListItem
+
+SHOPPING_LIST_FORMATS = {
+    'txt': 'text/plain; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+    'json': 'application/json',
+}
+
+
+class Echo:
+    """Псевдобуфер для csv.writer: возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def recipe_amounts(recipe):
+    """Словарь {id ингредиента: количество} для рецепта."""
+
+    return Counter(dict(
+        RecipeIngredients.objects.filter(
+            recipe=recipe
+        ).values_list('ingredient_id').annotate(amount=Sum('amount'))
+    ))
+
+
+def apply_shopping_list_delta(user_ids, deltas):
+    """Изменение списков покупок пользователей на deltas.
+
+    deltas - словарь {id ингредиента: изменение количества}. Вызывается
+    внутри транзакции; строки пользователей блокируются, чтобы
+    параллельные изменения одного списка выполнялись по очереди.
+    """
+
+    deltas = {id: delta for id, delta in deltas.items() if delta}
+    user_ids = list(user_ids)
+    if not deltas or not user_ids:
+        return
+    list(get_user_model().objects.select_for_update().filter(
+        pk__in=user_ids
+    ).order_by('pk').values_list('pk', flat=True))
+    items = ShoppingListItem.objects.filter(
+        user_id__in=user_ids,
+        ingredient_id__in=deltas
+    )
+    existing = set(items.values_list('user_id', 'ingredient_id'))
+    items.update(amount=F('amount') + Case(
+        *[When(ingredient_id=id, then=Value(delta))
+          for id, delta in deltas.items()],
+        output_field=IntegerField()
+    ))
+    ShoppingListItem.objects.bulk_create([
+        ShoppingListItem(user_id=user_id, ingredient_id=id, amount=delta)
+        for user_id in user_ids
+        for id, delta in deltas.items()
+        if delta > 0 and (user_id, id) not in existing
+    ])
+    items.filter(amount__lte=0).delete()
+
+
+def add_recipe_to_shopping_list(user, recipe):
+    """Добавление ингредиентов рецепта в список покупок пользователя."""
+
+    apply_shopping_list_delta((user.pk,), recipe_amounts(recipe))
+
+
+def remove_recipe_from_shopping_list(user, recipe):
+    """Удаление ингредиентов рецепта из списка покупок пользователя."""
+
+    apply_shopping_list_delta(
+        (user.pk,),
+        {id: -amount for id, amount in recipe_amounts(recipe).items()}
+    )
+
+
+def update_recipe_in_shopping_lists(recipe, old_amounts, new_amounts):
+    """Учёт изменения ингредиентов рецепта во всех списках покупок.
+
+    old_amounts и new_amounts - результаты recipe_amounts до и после
+    изменения; при удалении рецепта new_amounts пуст.
+    """
+
+    deltas = Counter(new_amounts)
+    deltas.subtract(old_amounts)
+    apply_shopping_list_delta(
+        ShoppingCart.objects.filter(
+            recipe=recipe
+        ).values_list('user_id', flat=True).distinct(),
+        deltas
+    )
+
+
+def live_shopping_list(user_ids=None):
+    """Агрегат корзин, посчитанный заново по RecipeIngredients.
+
+    Возвращает словарь {(id пользователя, id ингредиента): количество}.
+    """
+
+    rows = ShoppingCart.objects.filter(
+        recipe__recipe_ingredients__isnull=False
+    )
+    if user_ids is not None:
+        rows = rows.filter(user_id__in=user_ids)
+    return {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount in rows.values_list(
+            'user_id',
+            'recipe__recipe_ingredients__ingredient_id'
+        ).annotate(
+            amount=Sum('recipe__recipe_ingredients__amount')
+        ).order_by().iterator()
+    }
+
+
+def rebuild_shopping_lists(user_ids=None):
+    """Пересборка списков покупок по текущему содержимому корзин."""
+
+    live = live_shopping_list(user_ids)
+    with transaction.atomic():
+        items = ShoppingListItem.objects.all()
+        if user_ids is not None:
+            items = items.filter(user_id__in=user_ids)
+        items.delete()
+        ShoppingListItem.objects.bulk_create(
+            [
+                ShoppingListItem(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    amount=amount
+                )
+                for (user_id, ingredient_id), amount in live.items()
+            ],
+            batch_size=1000
+        )
+    return len(live)
+
+
+def shopping_list_rows(user, recipe_ids=None):
+    """Суммы ингредиентов из корзины пользователя.
+
+    Полный список читается из ShoppingListItem, список по части рецептов
+    (recipe_ids) агрегируется по RecipeIngredients. Строки читаются
+    курсором по мере итерации, без загрузки всей выборки в память.
+    """
+
+    if recipe_ids is None:
+        return ShoppingListItem.objects.filter(
+            user=user
+        ).values_list(
+            'ingredient__name',
+            'ingredient__measurement_unit',
+            'amount'
+        ).order_by('ingredient__name').iterator()
+    shopping_cart = ShoppingCart.objects.filter(
+        user=user,
+        recipe_id__in=recipe_ids
+    )
+    return RecipeIngredients.objects.filter(
+        recipe_id__in=shopping_cart.values('recipe_id')
+    ).values_list(
+        'ingredient__name',
+        'ingredient__measurement_unit'
+    ).annotate(amount=Sum('amount')).order_by('ingredient__name').iterator()
+
+
+def shopping_list_txt(rows):
+    for name, measurement_unit, amount in rows:
+        yield f'{name}: {measurement_unit}, {amount}\n'
+
+
+def shopping_list_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def shopping_list_json(rows):
+    separator = ''
+    yield '['
+    for name, measurement_unit, amount in rows:
+        yield separator + json.dumps(
+            {
+                'name': name,
+                'measurement_unit': measurement_unit,
+                'amount': amount
+            },
+            ensure_ascii=False
+        )
+        separator = ','
+    yield ']'
+
+
+SHOPPING_LIST_WRITERS = {
+    'txt': shopping_list_txt,
+    'csv': shopping_list_csv,
+    'json': shopping_list_json,
+}
+
+
+def shopping_list_stream(rows, file_format):
+    """Построчная выгрузка списка покупок в заданном формате."""
+
+    return SHOPPING_LIST_WRITERS[file_format](rows)
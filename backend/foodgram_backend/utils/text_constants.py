@@ -7,3 +7,15 @@ ENTRIES_IN_LIST_MORE_THAN_ONE = (
     'Количество элементов словаря'
     + ' должно быть больше 1.'
 )
+
+SHOPPING_LIST_FORMAT_ERROR = (
+    'Неизвестный формат списка покупок. Доступны: txt, csv, json.'
+)
+RECIPES_PARAM_ERROR = (
+    'Параметр recipes должен содержать id рецептов через запятую.'
+)
+RECIPES_LIMIT_ERROR = (
+    'Параметр recipes_limit должен быть положительным целым числом.'
+)
+
+INVALID_CURSOR = 'Некорректный курсор.'
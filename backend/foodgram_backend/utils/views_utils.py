@@ -1,3 +1,4 @@
+from django.db import IntegrityError, transaction
 from django.shortcuts import get_object_or_404
 from rest_framework import status
 from rest_framework.response import Response
@@ -11,33 +12,47 @@ def favorite(
         pk,
         model_to_add,
         model_to_serialize,
-        serializer_model
+        serializer_model,
+        on_add=None,
+        on_remove=None
 ):
-    """Добавление записи в избранное, удаление из избранного."""
+    """Добавление записи в избранное, удаление из избранного.
+
+    Повтор записи отсекает уникальное ограничение (user, recipe), а не
+    предварительный exists(), поэтому одновременные запросы не создают
+    дублей. on_add и on_remove вызываются с пользователем и рецептом
+    в той же транзакции, что и изменение записи.
+    """
 
     user = request.user
-    recipe = get_object_or_404(model_to_serialize, id=pk)
     if request.method == 'POST':
-        if not model_to_add.objects.filter(
-            user=user,
-            recipe=recipe
-        ).exists():
-            model_to_add.objects.create(user=request.user, recipe=recipe)
-            serializer = serializer_model(recipe)
+        recipe = get_object_or_404(model_to_serialize, id=pk)
+        try:
+            with transaction.atomic():
+                model_to_add.objects.create(user=user, recipe=recipe)
+                if on_add:
+                    on_add(user, recipe)
+        except IntegrityError:
             return Response(
-                serializer.data,
-                status=status.HTTP_201_CREATED
+                {'errors': text_constants.ADD_ENTRY_ERROR},
+                status=status.HTTP_400_BAD_REQUEST
             )
+        serializer = serializer_model(recipe)
         return Response(
-            {'errors': text_constants.ADD_ENTRY_ERROR},
-            status=status.HTTP_400_BAD_REQUEST
+            serializer.data,
+            status=status.HTTP_201_CREATED
         )
-    if model_to_add.objects.filter(
-        user=user,
-        recipe=recipe
-    ).exists():
-        model_to_add.objects.filter(user=user, recipe=recipe).delete()
+    with transaction.atomic():
+        entry = model_to_add.objects.select_for_update(
+            of=('self',)
+        ).select_related('recipe').filter(user=user, recipe_id=pk).first()
+        if entry is not None:
+            entry.delete()
+            if on_remove:
+                on_remove(user, entry.recipe)
+    if entry is not None:
         return Response(status=status.HTTP_204_NO_CONTENT)
+    get_object_or_404(model_to_serialize, id=pk)
     return Response(
         {'errors': text_constants.NO_ENTRY},
         status=status.HTTP_400_BAD_REQUEST